@@ -0,0 +1,79 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+"""Measure how many commands per second `eval_f()` parses, with the cached
+usage parsers of `harmonyqt.commands.parsing` and with `docopt.docopt()`.
+
+Usage: python3 bench/eval_throughput.py [RUNS]"""
+
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Sequence
+
+import docopt
+
+# pylint: disable=unused-import,wrong-import-order
+from harmonyqt import main  # Imports the modules in the right order
+from harmonyqt.commands import eval as m_eval
+from harmonyqt.commands import parsing, register
+
+RUNS = 2000
+
+# Typed commands, using the usage of /alias below
+TEXTS = (
+    "/bench /h /help",
+    "/bench /x",
+    "/bench /e '/say --echo' -s",
+    "/bench /e --remove",
+)
+
+
+@register(run_in_thread=False)
+def bench(_chat: Any, _args: dict) -> None:
+    r"""
+    Usage:
+      /bench ALIAS
+      /bench ALIAS COMMAND [-s|--single-arg|-g|--global|-G|--global-words]
+      /bench ALIAS --remove
+
+    Options:
+      -s, --single-arg
+      -g, --global
+      -G, --global-words
+      -r, --remove"""
+
+
+def docopt_parse_args(func: Callable, argv: Sequence[str]) -> Dict[str, Any]:
+    return docopt.docopt(func.__doc__, help=False, argv=argv)
+
+
+def measure(runs: int) -> float:
+    "Return the number of commands run per second by `eval_f()`."
+    chat  = SimpleNamespace(logger=SimpleNamespace(error=print))
+    start = time.perf_counter()
+
+    for i in range(runs):
+        m_eval.eval_f(chat, TEXTS[i % len(TEXTS)])
+
+    return runs / (time.perf_counter() - start)
+
+
+def main() -> None:
+    runs   = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    cached = measure(runs)
+
+    original           = parsing.parse_args
+    parsing.parse_args = docopt_parse_args
+    try:
+        uncached = measure(runs)
+    finally:
+        parsing.parse_args = original
+
+    print(f"docopt.docopt():      {uncached:8.0f} commands/s")
+    print(f"cached UsageParser:   {cached:8.0f} commands/s")
+    print(f"speedup:              {cached / uncached:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
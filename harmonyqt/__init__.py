@@ -2,13 +2,17 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import sys
+import time
 from typing import Callable, List, Optional, Set
 
-from pkg_resources import resource_filename
+# For --profile-startup, set before the slow imports
+# pylint: disable=wrong-import-position
+_STARTED_AT: float = time.perf_counter()
+
 from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication, QMainWindow
 
-from . import __about__, error_handler
+from . import __about__, error_handler, startup_profile
 # pylint: disable=redefined-builtin
 from .__about__ import __doc__
 
@@ -36,14 +40,27 @@ def on_ctrl_c() -> None:
 
 
 def run(argv: Optional[List[str]] = None) -> None:
+    argv    = list(argv or sys.argv)
+    phase   = startup_profile.phase
+    profile = None
+
+    if "--profile-startup" in argv:
+        argv.remove("--profile-startup")
+        profile = startup_profile.start(_STARTED_AT)
+
     from . import main
+
     # pylint: disable=global-statement
     global _APP
-    _APP = main.App(argv or sys.argv)
+    with phase("Create application"):
+        _APP = main.App(argv)
 
     global _MAIN_WINDOW
-    _MAIN_WINDOW = main.MainWindow()
-    _MAIN_WINDOW.construct()
+    with phase("Construct main window"):
+        _MAIN_WINDOW = main.MainWindow()
+        if profile:
+            profile.watch_first_paint(_MAIN_WINDOW)
+        _MAIN_WINDOW.construct()
 
     # Make CTRL-C work
     timer = QTimer()
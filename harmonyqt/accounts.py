@@ -1,30 +1,36 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv3.
 
+import atexit
 import base64
 import hashlib
 import json
 import os
 import threading
+import time
 from collections import UserDict
+from contextlib import contextmanager
 from multiprocessing.pool import ThreadPool
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 
 from atomicfile import AtomicFile
 from PyQt5.QtCore import QObject, QStandardPaths, pyqtSignal
 
 from matrix_client.client import MatrixClient
-from matrix_client.crypto.olm_device import OlmDevice
-from matrix_client.device import Device
 from matrix_client.errors import RoomEventDecryptError
 
-from harmonyqt.commands.devices import set_default_device_name_if_empty
+from . import main, main_window
+from .hooks import Hook
+from .utils import get_standard_path
 
 LOAD_NUM_EVENTS_ON_START = 10
 
-_CONFIG_LOCK   = threading.Lock()
-_CRYPT_DB_LOCK = threading.Lock()
+# Seconds to wait for other changes before saving the accounts config
+CONFIG_SAVE_DELAY = 1
+
+# Identifies a version of a file: (inode, modification time, size)
+FileStamp = Tuple[int, int, int]
 
 
 class _SignalObject(QObject):
@@ -36,11 +42,201 @@ class _SignalObject(QObject):
     decrypt_error = pyqtSignal(str, RoomEventDecryptError)  # User ID, error
 
 
+class _DBLock:
+    __slots__ = ("lock", "acquired", "contended", "waited")
+
+    def __init__(self) -> None:
+        self.lock      = threading.Lock()
+        self.acquired  = 0
+        self.contended = 0    # number of times the lock was already held
+        self.waited    = 0.0  # total seconds spent waiting for the lock
+
+
+class CryptDBLocks:
+    """One lock per account's crypto database, so that operations on
+    unrelated accounts don't wait for each other.
+
+    Databases locked together are always locked in the same order,
+    which prevents deadlocks."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._locks: Dict[str, _DBLock] = {}
+
+
+    @contextmanager
+    def hold(self, *user_ids: str) -> Iterator[None]:
+        "Lock the databases of `user_ids` for the duration of the block."
+        with self._lock:
+            locks = [self._locks.setdefault(uid, _DBLock())
+                     for uid in sorted(set(user_ids))]
+
+        held: List[_DBLock] = []
+        try:
+            for db_lock in locks:
+                if not db_lock.lock.acquire(blocking=False):
+                    start = time.perf_counter()
+                    db_lock.lock.acquire()
+                    db_lock.contended += 1
+                    db_lock.waited    += time.perf_counter() - start
+
+                db_lock.acquired += 1
+                held.append(db_lock)
+
+            yield
+        finally:
+            for db_lock in reversed(held):
+                db_lock.lock.release()
+
+
+    def stats(self) -> Dict[str, Tuple[int, int, float]]:
+        """Return `{user_id: (times acquired, times contended,
+        seconds waited)}`."""
+        with self._lock:
+            return {uid: (l.acquired, l.contended, l.waited)
+                    for uid, l in self._locks.items()}
+
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._locks.pop(user_id, None)
+
+
+class AccountsConfig:
+    """Accounts config file, loaded once and kept in memory.
+
+    The file is parsed again only if its inode, modification time or
+    size changed since it was last read or written.
+    Changes are saved `CONFIG_SAVE_DELAY` seconds after the last one,
+    pending changes are saved when the program exits."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        self._lock = threading.RLock()
+        self._accounts: List[Dict[str, str]]      = []
+        self._stamp:    Optional[FileStamp]       = None
+        self._timer:    Optional[threading.Timer] = None
+
+        atexit.register(self.save)
+
+
+    def _file_stamp(self) -> Optional[FileStamp]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+    def _load_if_changed(self) -> None:
+        "Must be called with the lock held."
+        if self._timer:  # unsaved changes, ours are the most recent
+            return
+
+        stamp = self._file_stamp()
+        if stamp is not None and stamp == self._stamp:
+            return
+
+        if stamp is None:  # Removed, it will be written again on change
+            self._accounts, self._stamp = [], None
+            return
+
+        with open(self.path, "r") as file:
+            accs = json.loads(file.read().strip() or "[]") or []
+
+        for acc in accs:
+            pw = acc["password"]
+            acc["password"] = \
+                str(base64.b85decode(base64.b64decode(pw))[::-1], "utf-8")
+
+        self._accounts, self._stamp = accs, stamp
+
+
+    def read(self) -> List[Dict[str, str]]:
+        with self._lock:
+            self._load_if_changed()
+            return [dict(acc) for acc in self._accounts]
+
+
+    def add(self, server_url: str, user_id: str, password: str) -> None:
+        params = {"server_url": server_url, "user_id": user_id,
+                  "password":   password}
+
+        with self._lock:
+            self._load_if_changed()
+
+            for i, acc in enumerate(self._accounts):
+                if acc["user_id"] == user_id:
+                    if acc == params:
+                        return
+
+                    self._accounts[i] = params
+                    break
+            else:
+                self._accounts.append(params)
+
+            self._save_later()
+
+
+    def remove(self, user_id: str) -> None:
+        with self._lock:
+            self._load_if_changed()
+            accounts = [a for a in self._accounts if a["user_id"] != user_id]
+
+            if len(accounts) != len(self._accounts):
+                self._accounts = accounts
+                self._save_later()
+
+
+    def _save_later(self) -> None:
+        "Must be called with the lock held."
+        if self._timer:
+            self._timer.cancel()
+
+        self._timer        = threading.Timer(CONFIG_SAVE_DELAY, self.save)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+    def save(self) -> None:
+        "Write pending changes now."
+        with self._lock:
+            if not self._timer:
+                return
+
+            self._timer.cancel()
+            self._timer = None
+
+            with AtomicFile(self.path, "w") as new:
+                new.write(self._serialize(self._accounts))
+
+            self._stamp = self._file_stamp()
+
+
+    @staticmethod
+    def _serialize(accounts: List[Dict[str, str]]) -> str:
+        encoded = []
+
+        for acc in accounts:
+            pw  = acc["password"]
+            byt = base64.b64encode(base64.b85encode(bytes(pw[::-1], "utf-8")))
+            encoded.append({**acc, "password": str(byt, "utf-8")})
+
+        return json.dumps(encoded, indent=4, ensure_ascii=False)
+
+
 class AccountManager(UserDict):
     def __init__(self) -> None:
         super().__init__()
-        self.signals: _SignalObject = _SignalObject()
-        self._pool:   ThreadPool    = ThreadPool(8)
+        self.signals:  _SignalObject = _SignalObject()
+        self.db_locks: CryptDBLocks  = CryptDBLocks()
+        self._pool:    ThreadPool    = ThreadPool(8)
+
+        self._config_path:  str                       = ""
+        self._configs:      Dict[str, AccountsConfig] = {}  # {path: config}
+        self._configs_lock: threading.Lock            = threading.Lock()
 
 
     # Login/logout
@@ -94,6 +290,10 @@ class AccountManager(UserDict):
         self.data[user_id] = client
         self.signals.login.emit(client)
 
+        # Commands are imported when first used, see harmonyqt.commands
+        from harmonyqt.commands.devices import (
+            set_default_device_name_if_empty
+        )
         set_default_device_name_if_empty(client)
 
         if new_crypt_db:
@@ -110,129 +310,68 @@ class AccountManager(UserDict):
         self.signals.logout.emit(user_id)
         self._pool.apply_async(self.data[user_id].logout)
         del self.data[user_id]
+        self.db_locks.forget(user_id)
         self.config_del(user_id)
 
 
     # Standard file paths
 
-    @staticmethod
-    def _get_standard_path(kind:            QStandardPaths.StandardLocation,
-                           file:            str,
-                           initial_content: Optional[str] = None) -> str:
-        relative_path = file.replace("/", os.sep)
-
-        path = QStandardPaths.locate(kind, relative_path)
-        if path:
-            return path
-
-        base_dir = QStandardPaths.writableLocation(kind)
-        path     = f"{base_dir}{os.sep}{relative_path}"
-        os.makedirs(os.path.split(path)[0], exist_ok=True)
-
-        if initial_content is not None:
-            with AtomicFile(path, "w") as new:
-                new.write(initial_content)
-
-        return path
-
-
     @property
     def standard_accounts_config_path(self) -> str:
-        return self._get_standard_path(
-            QStandardPaths.AppConfigLocation, "accounts.json", "[]"
-        )
+        if not self._config_path:
+            self._config_path = get_standard_path(
+                QStandardPaths.AppConfigLocation, "accounts.json", "[]"
+            )
+        return self._config_path
 
 
     def get_crypt_db_path(self, user_id: str) -> str:
         safe_filename = hashlib.md5(user_id.encode("utf-8")).hexdigest()
-        return self._get_standard_path(
+        return get_standard_path(
             QStandardPaths.AppDataLocation, f"encryption/{safe_filename}.db"
         )
 
 
     # Crypto database operations
 
-    def trust_our_other_accounts(self, client: MatrixClient) -> None:
-        to_add_for_client: Dict[str, Dict[str, Device]] = {}
-
-        def trust(dev: Device) -> Device:
-            dev.verified    = True
-            dev.blacklisted = False
-            dev.ignored     = False
-            return dev
-
-        our_dev: OlmDevice = trust(client.olm_device)
+    @staticmethod
+    def trust_our_other_accounts(client: MatrixClient) -> None:
+        main_window().device_info.trust_our_accounts(client)
 
-        with _CRYPT_DB_LOCK:
-            for other in self.data.values():
-                if other.user_id == client.user_id:
-                    continue
 
-                other_dev   = other.olm_device
-                to_add_devs = to_add_for_client.setdefault(other.user_id, {})
-                to_add_devs[other_dev.device_id] = other_dev
+    # Config file operations
 
-                other_dev.db.save_device_keys(
-                    {our_dev.user_id: {our_dev.device_id: our_dev}}
-                )
-                other_dev.db.load_device_keys(other.api, other_dev.device_keys)
+    def config(self, path: str = "") -> AccountsConfig:
+        path = path or self.standard_accounts_config_path
 
-            our_dev.db.save_device_keys(to_add_for_client)
-            our_dev.db.load_device_keys(client.api, our_dev.device_keys)
+        with self._configs_lock:
+            if path not in self._configs:
+                self._configs[path] = AccountsConfig(path)
 
+            return self._configs[path]
 
-    # Config file operations
 
     def config_read(self, path: str = "") -> List[Dict[str, str]]:
-        with open(path or self.standard_accounts_config_path, "r") as file:
-            accs = json.loads(file.read().strip()) or []
-
-        for acc in accs:
-            pw = acc["password"]
-            acc["password"] = \
-                str(base64.b85decode(base64.b64decode(pw))[::-1], "utf-8")
-
-        return accs
+        return self.config(path).read()
 
 
     def config_add(self, server_url: str, user_id: str, password: str,
                    path: str = "") -> None:
-        with _CONFIG_LOCK:
-            path     = path or self.standard_accounts_config_path
-            accounts = self.config_read(path)
-            params   = {"server_url": server_url, "user_id": user_id,
-                        "password":   password}
-
-            for i, acc in enumerate(accounts):
-                if acc["user_id"] == user_id:
-                    if acc == params:
-                        return
-
-                    accounts[i] = params
-                    break
-            else:
-                accounts.append(params)
-
-            with AtomicFile(path, "w") as new:
-                new.write(self._serialize_config(accounts))
+        self.config(path).add(server_url, user_id, password)
 
 
     def config_del(self, user_id: str, path: str = "") -> None:
-        with _CONFIG_LOCK:
-            path     = path or self.standard_accounts_config_path
-            accounts = self.config_read(path)
-            accounts = [a for a in accounts if a["user_id"] != user_id]
-
-            with AtomicFile(path, "w") as new:
-                new.write(self._serialize_config(accounts))
+        self.config(path).remove(user_id)
 
 
-    @staticmethod
-    def _serialize_config(accounts: List[Dict[str, str]]) -> str:
-        for acc in accounts:
-            pw  = acc["password"]
-            byt = base64.b64encode(base64.b85encode(bytes(pw[::-1], "utf-8")))
+def preload_config(window: main.MainWindow) -> None:
+    "Read the accounts config while the GUI is set up, before logging in."
+    try:
+        window.accounts.config_read()
+    except FileNotFoundError:
+        pass
 
-            acc["password"] = str(byt, "utf-8")
 
-        return json.dumps(accounts, indent=4, ensure_ascii=False)
+main.HOOKS_INIT_2_BEFORE_LOGIN["Read accounts config"] = Hook(
+    preload_config, gui=False
+)
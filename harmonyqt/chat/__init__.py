@@ -2,6 +2,6 @@
 # This file is part of harmonyqt, licensed under GPLv2.
 
 from .chat import (
-    CHAT_INIT_HOOKS, Chat, RoomNotJoinedError, UserNotLoggedInError
+    CHAT_INIT_HOOKS, Chat, ChatPool, RoomNotJoinedError, UserNotLoggedInError
 )
 from .dock import ChatDock
@@ -1,16 +1,25 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv2.
 
-from typing import Callable, Dict
+from threading import RLock
+from typing import Callable, Deque, Dict, Optional, Tuple, Union
 
 from cachetools import LFUCache
-from kids.cache import cache
 from PyQt5.QtWidgets import QVBoxLayout, QWidget
 
 from harmonyqt import main, main_window, message
+from harmonyqt.hooks import HookDict, run_hooks
 from matrix_client.errors import RoomEventDecryptError
 
-CHAT_INIT_HOOKS: Dict[str, Callable[["Chat"], None]] = {}
+# Values are harmonyqt.hooks.Hook objects, or functions taking the Chat
+CHAT_INIT_HOOKS: HookDict = {}
+
+# Max number of Chat widgets kept alive, not counting the ones shown in docks
+CHAT_POOL_SIZE = 16
+# Max number of messages kept for each room without a Chat widget
+BUFFER_SIZE = 1000
+
+Buffered = Union[message.Message, RoomEventDecryptError]
 
 
 class UserNotLoggedInError(Exception):
@@ -22,7 +31,6 @@ class RoomNotJoinedError(Exception):
         super().__init__(f"{user_id!r} is not part of the room {room_id!r}.")
 
 
-@cache(use=LFUCache(maxsize=64))
 class Chat(QWidget):
     def __init__(self, user_id: str, room_id: str) -> None:
         super().__init__()
@@ -55,21 +63,129 @@ class Chat(QWidget):
         self.vbox.addWidget(self.display)
         self.vbox.addWidget(self.send_area)
 
-        for hook in CHAT_INIT_HOOKS.values():
-            hook(self)
+        # {hook name: seconds taken}
+        self.init_hook_timings = run_hooks(CHAT_INIT_HOOKS, self,
+                                           kind="Chat hook")
+
+
+    def teardown(self) -> None:
+        "Stop threads and unregister hooks, then schedule deletion."
+        self.display.teardown()
+        self.send_area.box.teardown()
+        self.deleteLater()
+
+
+class _EvictingLFUCache(LFUCache):
+    def __init__(self, maxsize: int, on_evict: Callable[[Chat], None]
+                ) -> None:
+        super().__init__(maxsize)
+        self.on_evict = on_evict
+
+
+    def popitem(self) -> Tuple[Tuple[str, str], Chat]:
+        key, chat = super().popitem()
+        self.on_evict(chat)
+        return (key, chat)
+
+
+class ChatPool:
+    """Create `Chat` widgets on demand and keep the most used ones alive.
+
+    Messages for rooms without a `Chat` are buffered, and shown when it is
+    opened. Chats shown in a dock are pinned, other ones are torn down when
+    the pool is full, least frequently used first; their messages go back
+    to the buffer."""
+
+    def __init__(self,
+                 maxsize:     int = CHAT_POOL_SIZE,
+                 buffer_size: int = BUFFER_SIZE) -> None:
+        self.buffer_size = buffer_size
+        self.lock        = RLock()
+
+        self.chats = _EvictingLFUCache(maxsize, on_evict=self._teardown)
+        # {(user_id, room_id): chat}
+        self.pinned:  Dict[Tuple[str, str], Chat]            = {}
+        self.buffers: Dict[Tuple[str, str], Deque[Buffered]] = {}
+
+
+    def get(self, user_id: str, room_id: str) -> Optional[Chat]:
+        "Return an existing `Chat` without creating it."
+        with self.lock:
+            return self.pinned.get((user_id, room_id)) or \
+                   self.chats.get((user_id, room_id))
+
+
+    def open(self, user_id: str, room_id: str) -> Chat:
+        "Return the `Chat` for `room_id` and `user_id`, create it if needed."
+        with self.lock:
+            chat = self.get(user_id, room_id)
+            if chat:
+                return chat
+
+            chat = Chat(user_id, room_id)
+            self.chats[user_id, room_id] = chat
+
+            for item in self.buffers.pop((user_id, room_id), ()):
+                self._show(chat, item)
+
+            return chat
+
+
+    def pin(self, chat: Chat) -> None:
+        key = (chat.client.user_id, chat.room.room_id)
+
+        with self.lock:
+            self.chats.pop(key, None)
+            self.pinned[key] = chat
+
+
+    def unpin(self, chat: Chat) -> None:
+        key = (chat.client.user_id, chat.room.room_id)
+
+        with self.lock:
+            if self.pinned.pop(key, None):
+                self.chats[key] = chat
+
+
+    def add(self, user_id: str, room_id: str, item: Buffered) -> None:
+        "Show a message or decryption error, or buffer it for later."
+        with self.lock:
+            chat = self.get(user_id, room_id)
+
+            if chat:
+                self._show(chat, item)
+                return
+
+            if (user_id, room_id) not in self.buffers:
+                self.buffers[user_id, room_id] = Deque(maxlen=self.buffer_size)
+
+            self.buffers[user_id, room_id].append(item)
+
+
+    @staticmethod
+    def _show(chat: Chat, item: Buffered) -> None:
+        if isinstance(item, RoomEventDecryptError):
+            chat.display.on_decrypt_error(item)
+        else:
+            chat.display.on_receive_from_server(item)
+
+
+    def _teardown(self, chat: Chat) -> None:
+        key = (chat.client.user_id, chat.room.room_id)
+        self.buffers[key] = Deque(chat.display.added_msgs,
+                                  maxlen=self.buffer_size)
+        chat.teardown()
 
 
 def redirect_message(msg: message.Message) -> None:
     if msg.receiver_id is None:  # local echo
         return
 
-    chat = Chat(msg.receiver_id, msg.room_id)  # cache
-    chat.display.on_receive_from_server(msg)
+    main_window().chats.add(msg.receiver_id, msg.room_id, msg)
 
 
 def redirect_decrypt_error(user_id: str, err: RoomEventDecryptError) -> None:
-    chat = Chat(user_id, err.room.room_id)
-    chat.display.on_decrypt_error(err)
+    main_window().chats.add(user_id, err.room.room_id, err)
 
 
 main.HOOKS_INIT_2_BEFORE_LOGIN["Connect chat Message redirector"] = (
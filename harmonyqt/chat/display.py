@@ -2,20 +2,36 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import time
-from threading import Thread
-from typing import Deque, Tuple
+from collections import Counter, OrderedDict
+from threading import Event, Thread
+from typing import Deque, Dict, List, Tuple
 
+from dataclasses import dataclass, field
 from PyQt5.QtCore import QDateTime, Qt, pyqtSignal
-from PyQt5.QtGui import QKeyEvent, QTextCursor, QTextLength, QTextTableFormat
+from PyQt5.QtGui import (
+    QKeyEvent, QTextCursor, QTextLength, QTextTable, QTextTableFormat
+)
 
 from matrix_client.errors import (
     MegolmDecryptMissingKeysError, RoomEventDecryptError
 )
 
 from . import Chat
-from .. import message_display
+from .. import main_window, message_display
 from ..message import Message
 
+# Max number of local echoes remembered while waiting for their server version
+LOCAL_ECHO_MAX = 512
+# Seconds after which sent echoes never received from the server are dropped
+LOCAL_ECHO_LIFETIME = 10 * 60
+
+
+@dataclass
+class LocalEcho:
+    msg:   Message
+    table: QTextTable  # info/content table of the displayed message
+    added: float = field(default_factory=time.monotonic)
+
 
 class ChatMessageDisplay(message_display.MessageDisplay):
     _add_message_request = pyqtSignal(Message)
@@ -55,36 +71,185 @@ class ChatMessageDisplay(message_display.MessageDisplay):
 
         self.added_msgs: Deque[Message] = Deque()
 
-        # [(msg.sender_id, msg.markdown)]
-        self.received_by_local_echo: Deque[Tuple[str, str]] = Deque()
+        # {txn_id or event_id once sent: echo}, oldest first
+        self.local_echoes: "OrderedDict[str, LocalEcho]" = OrderedDict()
+        # {sender_id: number of local echoes not sent yet}
+        self.pending_echoes: Counter = Counter()
+        # {event_id: msg} server messages that can be for a pending echo
+        self.early_msgs: "OrderedDict[str, Message]" = OrderedDict()
+
+        # {sender_id: [(msg, info/content table)]} for messages shown with
+        # the sender's ID while their display name is being looked up
+        self.unresolved_names: Dict[str, List[Tuple[Message, QTextTable]]] = {}
+
+        # {event_id: (error msg, info/content table)} for decryption errors
+        # to replace if the event can be decrypted later
+        self.decrypt_errors: Dict[str, Tuple[Message, QTextTable]] = {}
 
         uid, rid = self.chat.client.user_id, self.chat.room.room_id
 
-        Message.local_echo_hooks[(type(self).__name__, uid, rid)] = \
+        self._echo_hook_id = (type(self).__name__, uid, rid)
+        Message.local_echo_hooks[self._echo_hook_id] = \
             self.on_receive_local_echo
 
+        self._closed = Event()
         Thread(target=self.autoload_history, daemon=True).start()
 
         self._add_message_request.connect(self._add_message)
 
+        outbox_signals = main_window().outbox.signals
+        outbox_signals.message_state.connect(self.on_message_state)
+        outbox_signals.send_error.connect(self.on_send_error)
+
+        main_window().display_names.signals.sender_resolved.connect(
+            self.on_sender_resolved
+        )
+
+
+    def teardown(self) -> None:
+        self._closed.set()
+        Message.local_echo_hooks.pop(self._echo_hook_id, None)
+
+        outbox_signals = main_window().outbox.signals
+        outbox_signals.message_state.disconnect(self.on_message_state)
+        outbox_signals.send_error.disconnect(self.on_send_error)
+
+        main_window().display_names.signals.sender_resolved.disconnect(
+            self.on_sender_resolved
+        )
+
+        self.local_echoes.clear()
+        self.early_msgs.clear()
+        self.unresolved_names.clear()
+        self.decrypt_errors.clear()
+        self._system_blocks.clear()
+        self.document().clear()
+
 
     def on_receive_local_echo(self, msg: Message) -> None:
         if msg.room_id != self.chat.room.room_id:
             return
 
         msg.receiver_id = self.chat.client.user_id
-        self.received_by_local_echo.append((msg.sender_id, msg.markdown))
         self._add_message_request.emit(msg)
 
 
+    def on_message_state(self, _: str, room_id: str, txn_id: str, state: str,
+                         event_id: str) -> None:
+        if room_id != self.chat.room.room_id:
+            return
+
+        echo = self.local_echoes.pop(txn_id, None)
+        if not echo:  # already replaced by its server version
+            return
+
+        self._forget_pending(echo)
+        echo.msg.state = "failed" if state == "failed" else ""
+        self._replace_content(echo.table, echo.msg)
+
+        if state == "sent" and event_id:
+            early = self.early_msgs.pop(event_id, None)
+            if early:
+                self._replace_echo(echo, early)
+            else:
+                echo.msg.event_id           = event_id
+                self.local_echoes[event_id] = echo
+
+        self._add_early_msgs(echo.msg.sender_id)
+        self._prune_local_echoes()
+
+
+    def on_send_error(self, user_id: str, room_id: str, _: str, error: str
+                     ) -> None:
+        if (user_id, room_id) == (self.chat.client.user_id,
+                                  self.chat.room.room_id):
+            self.logger.error(f"Failed sending message: {error}")
+
+
+    def on_sender_resolved(self, user_id: str, _: str) -> None:
+        for msg, table in self.unresolved_names.pop(user_id, ()):
+            if table.rows() > 1:  # the info row is removed for consecutive
+                self._replace_cell(table, 0, msg.html_info)
+
+
     # Called from harmonyqt.chat.redirect_message()
     def on_receive_from_server(self, msg: Message) -> None:
-        try:
-            self.received_by_local_echo.remove((msg.sender_id, msg.markdown))
-        except ValueError:  # not found in list/deque
+        error = self.decrypt_errors.pop(msg.event_id, None)
+        if error:
+            self._replace_decrypt_error(*error, msg)
+            return
+
+        # The transaction ID is only in events sent by the receiver's device,
+        # the event ID is known once the outbox got the server's response.
+        echo = (msg.txn_id and self.local_echoes.pop(msg.txn_id, None)) or \
+               self.local_echoes.pop(msg.event_id, None)
+
+        if echo:
+            self._forget_pending(echo)
+            self._replace_echo(echo, msg)
+
+        # Our other accounts may receive the message before it's confirmed
+        elif self.pending_echoes[msg.sender_id] > 0:
+            self.early_msgs[msg.event_id] = msg
+
+            while len(self.early_msgs) > LOCAL_ECHO_MAX:
+                self._add_message_request.emit(
+                    self.early_msgs.popitem(last=False)[1]
+                )
+        else:
             self._add_message_request.emit(msg)
 
 
+    def _replace_echo(self, echo: LocalEcho, msg: Message) -> None:
+        # Keep the echo's timestamp so the message doesn't move
+        echo.msg.markdown = msg.markdown
+        echo.msg.html     = msg.html
+        echo.msg.event_id = msg.event_id
+        echo.msg.state    = ""
+        self.local_echoes.pop(echo.msg.event_id, None)
+        self.local_echoes.pop(echo.msg.txn_id, None)
+        self._replace_content(echo.table, echo.msg)
+
+
+    def _replace_decrypt_error(self, error: Message, table: QTextTable,
+                               msg: Message) -> None:
+        # Replace the error's content, so that it's kept if the chat is
+        # buffered and shown again
+        error.markdown = msg.markdown
+        error.html     = msg.html
+        error.state    = ""
+        self._replace_content(table, error)
+
+
+    def _forget_pending(self, echo: LocalEcho) -> None:
+        if echo.msg.state == "pending":
+            self.pending_echoes[echo.msg.sender_id] -= 1
+
+
+    def _add_early_msgs(self, sender_id: str) -> None:
+        "Show early messages that turned out to not be for our echoes."
+        if self.pending_echoes[sender_id] > 0:
+            return
+
+        for event_id, msg in list(self.early_msgs.items()):
+            if msg.sender_id == sender_id:
+                del self.early_msgs[event_id]
+                self._add_message_request.emit(msg)
+
+
+    def _prune_local_echoes(self) -> None:
+        while self.local_echoes:
+            oldest = next(iter(self.local_echoes.values()))
+            expired = (oldest.msg.state != "pending" and
+                       time.monotonic() - oldest.added > LOCAL_ECHO_LIFETIME)
+
+            if not expired and len(self.local_echoes) <= LOCAL_ECHO_MAX:
+                break
+
+            self._forget_pending(self.local_echoes.popitem(last=False)[1])
+            self._add_early_msgs(oldest.msg.sender_id)
+
+
     # Same as above
     def on_decrypt_error(self, err: RoomEventDecryptError) -> None:
         html = "<span class=decrypt-error>%s</span>"
@@ -105,6 +270,8 @@ class ChatMessageDisplay(message_display.MessageDisplay):
             sender_id      = err.event["sender"],
             ms_since_epoch = err.event["origin_server_ts"],
             html           = html,
+            event_id       = err.event["event_id"],
+            state          = "undecrypted",
         ))
 
 
@@ -196,16 +363,37 @@ class ChatMessageDisplay(message_display.MessageDisplay):
             cursor.insertHtml(msg.html_avatar)
         cursor.movePosition(QTextCursor.NextBlock)
 
+        names        = main_window().display_names
+        unknown_name = False
+
         if consecutive:
-            cursor.insertTable(1, 1, self.inner_info_content_format)
+            table = cursor.insertTable(1, 1, self.inner_info_content_format)
         else:
-            cursor.insertTable(2, 1, self.inner_info_content_format)
+            # Name lookup started, on_sender_resolved will update the info
+            unknown_name = \
+                names.sender_name(msg.sender_id, msg.room_id) == \
+                msg.sender_id and names.resolving(msg.sender_id)
+
+            table = cursor.insertTable(2, 1, self.inner_info_content_format)
             cursor.insertHtml(msg.html_info)
             cursor.movePosition(QTextCursor.NextBlock)
 
         cursor.insertHtml(msg.html_content)
 
         cursor.endEditBlock()
+
+        if unknown_name:
+            self.unresolved_names.setdefault(msg.sender_id, []).append(
+                (msg, table)
+            )
+
+        if msg.state == "undecrypted":
+            self.decrypt_errors[msg.event_id] = (msg, table)
+
+        if msg.state == "pending":
+            self.local_echoes[msg.txn_id] = LocalEcho(msg, table)
+            self.pending_echoes[msg.sender_id] += 1
+            self._prune_local_echoes()
         self.last_table_is_message = True
 
         if to_top:
@@ -215,6 +403,13 @@ class ChatMessageDisplay(message_display.MessageDisplay):
             self.scroller.go_min_left().go_bottom()
 
 
+    def _replace_content(self, info_content_table: QTextTable, msg: Message
+                        ) -> None:
+        table = info_content_table
+        # Info row may be gone
+        self._replace_cell(table, table.rows() - 1, msg.html_content)
+
+
     def autoload_history(self) -> None:
         time.sleep(0.25)  # Give time for initial events/msgs to be shown
         scr          = self.scroller
@@ -231,7 +426,8 @@ class ChatMessageDisplay(message_display.MessageDisplay):
                 elif scr.v <= scr.vmin:
                     load_history(100)
 
-            time.sleep(0.1)
+            if self._closed.wait(0.1):
+                return
 
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
@@ -1,53 +1,92 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv2.
 
-from multiprocessing.pool import ThreadPool
+from typing import Optional
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import QWidget
 
 from . import Chat
 from .. import dock, main_window
+from ..executor import HIGH, Task
 
 
 class ChatDock(dock.Dock):
+    title_resolved = pyqtSignal(str)
+
+
     def __init__(self, user_id: str, room_id: str, parent: QWidget) -> None:
         self.user_id: str = user_id
         self.room_id: str = room_id
         super().__init__(f"{self.user_id}: {self.room_id}",
                          parent=parent, can_hide_title_bar=False)
 
-        self._pool = ThreadPool(1)
+        self._title_task: Optional[Task] = None
+        self.title_resolved.connect(self.set_title)
         self.autoset_title()
 
         self.change_room(self.user_id, self.room_id)
 
         self.visibilityChanged.connect(self.on_visibility_change)
         self.dockLocationChanged.connect(self.on_location_change)
+        # Unlike visibilityChanged, not triggered by switching tabs
+        self.toggleViewAction().toggled.connect(self.on_open_change)
 
 
     def autoset_title(self) -> None:
         def get() -> str:
             client = main_window().accounts[self.user_id]
-            return ": ".join((client.user.get_display_name(),
-                              client.rooms[self.room_id].display_name))
+            names  = main_window().display_names
+            return ": ".join((names.user_name(client),
+                              names.room_name(client,
+                                              client.rooms[self.room_id])))
 
-        def set_(title: str) -> None:
-            self.title = title
+        if self._title_task:  # Still for the previous room
+            self._title_task.cancel()
 
-        self._pool.apply_async(get, callback=set_)
+        self._title_task = main_window().executor.submit(
+            get,
+            kind     = "display_name",
+            priority = HIGH,
+            callback = self.title_resolved.emit,
+        )
 
 
-    def change_room(self, to_user_id: str, to_room_id: str) -> None:
-        main_window().visible_chat_docks.pop((self.user_id, self.room_id),
-                                             None)
+    def set_title(self, title: str) -> None:
+        self.title = title
 
+
+    def change_room(self, to_user_id: str, to_room_id: str) -> None:
+        self._release_chat()
         self.user_id, self.room_id = to_user_id, to_room_id
-        self.chat = Chat(self.user_id, self.room_id)
-        self.setWidget(self.chat)
+        self._acquire_chat()
         self.autoset_title()
 
-        main_window().visible_chat_docks[(self.user_id, self.room_id)] = self
+
+    def _acquire_chat(self) -> None:
+        """Open and pin the chat shown by this dock, including while it is a
+        background tab. It is opened again if the pool tore it down while
+        the dock was closed."""
+        ids   = (self.user_id, self.room_id)
+        chats = main_window().chats
+
+        self.chat: Chat = chats.open(*ids)
+        chats.pin(self.chat)
+
+        if self.widget() is not self.chat:
+            self.setWidget(self.chat)
+
+        main_window().visible_chat_docks[ids] = self
+        main_window().unread.mark_read(*ids)
+
+
+    def _release_chat(self) -> None:
+        "Let the pool tear down this dock's chat when it needs room."
+        main_window().visible_chat_docks.pop((self.user_id, self.room_id),
+                                             None)
+
+        if getattr(self, "chat", None):
+            main_window().chats.unpin(self.chat)
 
 
     def focus(self) -> None:
@@ -59,10 +98,19 @@ class ChatDock(dock.Dock):
         ids = (self.user_id, self.room_id)
         if visible:
             main_window().visible_chat_docks[ids] = self
+            main_window().unread.mark_read(*ids)
         else:
             main_window().visible_chat_docks.pop(ids, None)
 
 
+    def on_open_change(self, opened: bool) -> None:
+        # Closed docks are only hidden, they must not keep their chat pinned
+        if opened:
+            self._acquire_chat()
+        else:
+            self._release_chat()
+
+
     def on_location_change(self, _: Qt.AllDockWidgetAreas) -> None:
         # Needed for situations where user drags a dock then opens a new
         # chat, since the location of that new chat dock is dependent on
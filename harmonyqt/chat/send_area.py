@@ -97,6 +97,10 @@ class SendBox(QPlainTextEdit):
         raise err
 
 
+    def teardown(self) -> None:
+        self._pool.close()
+
+
 class SendArea(QWidget):
     def __init__(self, chat: Chat) -> None:
         super().__init__(chat)
@@ -3,8 +3,9 @@
 
 r''' OUDATED
 Registered functions represent commands.
-A command will be started in its own thread to not block the client, unless
-`@register_command(run_in_thread=False)` is used.
+Commands run on a bounded pool of worker threads to not block the client,
+one at a time for each chat (see `jobs.CommandQueue`), unless
+`@register(run_in_thread=False)` is used.
 
 Functions will receive a `harmonyqt.chat.Chat` object as first argument,
 representing the chat from which the user typed the command.
@@ -54,15 +55,16 @@ inside quotes, or the bad character must be escaped using a
 backslash (`\`) before it.'''
 
 import functools
+import importlib
 import shlex
 import pdb as actual_pdb
 import traceback
-from threading import Thread
 from typing import Callable, Dict, List, Optional, Union
 
 from PyQt5.QtCore import pyqtRemoveInputHook
 
 from ..chat import Chat
+from .jobs import COMMAND_QUEUE
 
 FuncType = Callable[..., None]
 
@@ -91,8 +93,9 @@ def register(func: Optional[FuncType] = None, run_in_thread: bool = True):
             if _pdb_level > 0 or not run_in_thread:
                 executor(*args_, _pdb_level=_pdb_level, **kwargs)
             else:
-                Thread(target=executor, args=args_, kwargs=kwargs, daemon=True
-                      ).start()
+                COMMAND_QUEUE.submit(
+                    chat, func.__name__, lambda: executor(*args_, **kwargs)
+                )
 
         REGISTERED_COMMANDS[func.__name__] = wrapper
         return wrapper
@@ -103,8 +106,26 @@ def register(func: Optional[FuncType] = None, run_in_thread: bool = True):
     return decorator
 
 
+def get_command(name: str) -> Optional[FuncType]:
+    "Return the registered command `name`, importing its module if needed."
+    if name not in REGISTERED_COMMANDS and name in LAZY_COMMANDS:
+        importlib.import_module(f"{__name__}.{name}")
+
+    return REGISTERED_COMMANDS.get(name)
+
+
+def command_names() -> List[str]:
+    return sorted(set(REGISTERED_COMMANDS) | set(LAZY_COMMANDS))
+
+
 # pylint: disable=wrong-import-position,redefined-builtin,reimported
 # Standard core commands, cannot be disabled
 from . import eval, say, help
-# Other commands
-from . import alias, autorun, devices, nick, pdb, shell, room_set
+# Commands that add chat or parsing hooks, must be loaded before they're used
+from . import alias, autorun
+
+# Other commands, only imported when first used by get_command().
+# Their module and command names must be the same.
+LAZY_COMMANDS = (
+    "cancel", "devices", "nick", "outbox", "pdb", "shell", "room_set"
+)
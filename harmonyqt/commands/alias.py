@@ -3,7 +3,8 @@
 
 import re
 import shlex
-from typing import Dict
+from threading import RLock
+from typing import Dict, Iterable, List, Match, Optional, Pattern
 
 from dataclasses import dataclass
 
@@ -11,9 +12,17 @@ from . import eval as m_eval
 from . import register
 from ..chat import Chat
 
+# Max number of times a command alias can expand to another command alias
+MAX_EXPANSIONS = 16
+
 REGISTERED_ALIASES: Dict[str, "Alias"] = {}
 
 
+class AliasRecursionError(Exception):
+    def __init__(self, chain: List[str]) -> None:
+        super().__init__(f"Too many nested aliases: `{' → '.join(chain)}`.")
+
+
 @dataclass
 class Alias:
     alias:           str  = ""
@@ -28,47 +37,133 @@ class Alias:
         assert sum((self.single_arg, self.is_global, self.is_global_words)) < 2
 
 
-    def expand(self, _: Chat, typed_text: str, force_say: bool = False) -> str:
-        re_alias = re.escape(self.alias)
-        re_ex    = self.expands_to.replace("\\", "\\\\")
+    def expand_command(self, args: Optional[str]) -> str:
+        "Return the text for this command alias used with `args`."
+        if args is None:
+            return self.expands_to
 
-        if self.is_global_words:
-            text = re.sub(rf"(^|[^\\])({re_alias})", rf"\1{re_ex}", typed_text)
-            return re.sub(rf"\\({re_alias})",        r"\1",         text)
+        text = self.expands_to
+        text = text if "{}" in text else "%s {}" % text
 
-        if self.is_global:
-            text = re.sub(rf"(?:^|(?<=\s))({re_alias})(?=$|\s)",
-                          re_ex, typed_text)
-            return re.sub(rf"(?:^|(?<=\s))\\({re_alias})(?=$|\s)",
-                          rf"\1", text)
+        return text.format(shlex.quote(args) if self.single_arg else args)
 
-        if force_say:
-            return typed_text
 
-        first_word, *rest = re.split(r"\s", typed_text, maxsplit=1)
+    def register(self) -> None:
+        REGISTERED_ALIASES[self.alias] = self
+        ENGINE.invalidate()
 
-        if first_word != self.alias:
-            return typed_text
+    def unregister(self) -> None:
+        del REGISTERED_ALIASES[self.alias]
+        ENGINE.invalidate()
 
-        if rest == []:
-            return self.expands_to
 
-        text = self.expands_to
-        text = text if "{}" in text else "%s {}" % text
+def trie_regex(words: Iterable[str]) -> str:
+    """Return a regex matching any of `words`, longest first.
+    Common prefixes are factored, so that matching doesn't slow down with
+    the number of words like a `word1|word2|...` alternation does."""
+    trie: dict = {}
 
-        if self.single_arg:
-            return text.format(shlex.quote(rest[0]))
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # end of word
 
-        return text.format(rest[0])
+    def build(node: dict) -> str:
+        alts = [re.escape(char) + build(child)
+                for char, child in sorted(node.items()) if char]
+        if not alts:
+            return ""
+        if "" in node:
+            return f"(?:{'|'.join(alts)})?"
+        return alts[0] if len(alts) == 1 else f"(?:{'|'.join(alts)})"
 
+    return build(trie)
 
-    def register(self) -> None:
-        REGISTERED_ALIASES[self.alias]                    = self
-        m_eval.EVAL_PARSING_HOOKS[f"alias: {self.alias}"] = self.expand
 
-    def unregister(self) -> None:
-        del REGISTERED_ALIASES[self.alias]
-        del m_eval.EVAL_PARSING_HOOKS[f"alias: {self.alias}"]
+class AliasEngine:
+    """Expand all registered aliases of a text in one pass.
+
+    Global aliases are compiled into a single regex, rebuilt only when
+    aliases change. Command aliases are found with a dict lookup of the
+    first word, and can expand to other command aliases."""
+
+    def __init__(self) -> None:
+        self._lock  = RLock()
+        self._regex: Optional[Pattern] = None
+        self._dirty: bool              = True
+
+        # {alias: expansion} for global aliases
+        self._globals: Dict[str, str] = {}
+
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._dirty = True
+
+
+    def _compile(self) -> None:
+        words = [a for a in REGISTERED_ALIASES.values() if a.is_global]
+        anys  = [a for a in REGISTERED_ALIASES.values() if a.is_global_words]
+        parts = []
+
+        if words:
+            # Whole words only, \alias to escape
+            parts.append(rf"(?<!\S)(?P<word_esc>\\?)"
+                         rf"(?P<word>{trie_regex(a.alias for a in words)})"
+                         r"(?!\S)")
+        if anys:
+            # Anywhere, even in the middle of words
+            parts.append(rf"(?P<any_esc>\\?)"
+                         rf"(?P<any>{trie_regex(a.alias for a in anys)})")
+
+        self._globals = {a.alias: a.expands_to for a in words + anys}
+        self._regex   = re.compile("|".join(parts)) if parts else None
+        self._dirty   = False
+
+
+    def _replace_global(self, match: Match) -> str:
+        kind = "word" if match.group("word") is not None else "any"
+        name = match.group(kind)
+        return name if match.group(f"{kind}_esc") else self._globals[name]
+
+
+    def expand(self, chat: Chat, typed_text: str, force_say: bool = False
+              ) -> str:
+        with self._lock:
+            if self._dirty:
+                self._compile()
+
+            text = typed_text
+            if self._regex:
+                text = self._regex.sub(self._replace_global, text)
+
+            if force_say:
+                return text
+
+            chain: List[str] = []
+
+            while True:
+                first_word, *rest = re.split(r"\s", text, maxsplit=1)
+                got               = REGISTERED_ALIASES.get(first_word)
+
+                # Like in shells, an alias expanding to itself, directly or
+                # not, is treated as the real command the second time.
+                if not got or got.is_global or got.is_global_words or \
+                   first_word in chain:
+                    return text
+
+                chain.append(first_word)
+                if len(chain) > MAX_EXPANSIONS:
+                    chat.logger.error(str(AliasRecursionError(chain)))
+                    return ""
+
+                text = got.expand_command(rest[0] if rest else None)
+
+
+ENGINE = AliasEngine()
+
+m_eval.EVAL_PARSING_HOOKS["aliases"] = ENGINE.expand
 
 
 @register
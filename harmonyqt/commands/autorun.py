@@ -3,11 +3,14 @@
 
 import json
 import os
-from typing import List
+from threading import RLock
+from typing import List, Optional, Set
 
 from atomicfile import AtomicFile
+from PyQt5.QtCore import QFileSystemWatcher
 
 from . import register
+from .. import main_window
 from ..chat import CHAT_INIT_HOOKS, Chat
 from ..utils import get_config_path
 from .eval import eval_f
@@ -28,9 +31,15 @@ def autorun(chat: Chat, args: dict) -> None:
     If no `COMMANDS` is passed, the `autorun.json` file path will be printed.
     Commands can be manually added, edited or removed in this file.
 
+    Commands run once per session, when the first chat is opened.
+    To run a command for every chat instead, write it in the file as
+    `{"command": "/some command", "per_chat": true}`.
+    Changes to the file are applied automatically, new commands run in
+    the current chat or the next opened one.
+
     Options:
       -r, --reload
-        Reload `autorun.json` and execute its commands.
+        Reload `autorun.json` and execute all its commands again.
         Note that if you remove a command that had a durable effect like
         `/alias`, the effect will persist until Harmony is restarted.
 
@@ -44,50 +53,165 @@ def autorun(chat: Chat, args: dict) -> None:
     ```"""
 
     if args["--reset"]:
-        reset_autorun_json(chat)
+        AUTORUN.reset(chat)
     elif args["--reload"]:
-        load_autorun_json(chat)
+        AUTORUN.reload(chat)
 
     if not args["COMMANDS"]:
         chat.logger.info(get_autorun_json_path())
         return
 
     for cmd in args["COMMANDS"]:
-        add_command(chat, cmd)
+        AUTORUN.add_command(chat, cmd)
 
 
 def get_autorun_json_path() -> str:
     return get_config_path("autorun.json", DEFAULT_CONFIG)
 
 
-def load_autorun_json(chat: Chat) -> None:
-    with open(get_autorun_json_path(), "r") as in_file:
-        config: List[str] = json.loads(in_file.read())
+class Autorun:
+    """Commands of `autorun.json`, parsed once and re-parsed when the file
+    changes.
+
+    Session commands that already ran aren't executed again when a chat is
+    opened or the file changes, only new ones are."""
+
+    def __init__(self) -> None:
+        self.session:  List[str] = []
+        self.per_chat: List[str] = []
+        self.ran:      Set[str]  = set()  # session commands executed
+        self.loaded:   bool      = False
+
+        self._lock = RLock()
+        self._watcher: Optional[QFileSystemWatcher] = None
+
+
+    def compile(self) -> None:
+        "Parse `autorun.json` into the session and per chat command lists."
+        try:
+            with open(get_autorun_json_path(), "r") as in_file:
+                config = json.loads(in_file.read())
+
+            assert isinstance(config, list), \
+                   "Content of `autorun.json` must be a JSON list."
+
+            session, per_chat = [], []
+
+            for entry in config:
+                if isinstance(entry, str):
+                    session.append(entry)
+                    continue
+
+                assert isinstance(entry, dict) and \
+                       isinstance(entry.get("command"), str), \
+                       "Entries of `autorun.json` must be strings or " \
+                       "{\"command\": \"...\", \"per_chat\": true} objects."
+
+                (per_chat if entry.get("per_chat") else session)\
+                    .append(entry["command"])
+        except Exception:
+            with self._lock:
+                self.loaded = False  # raise again on next chat init
+            raise
+
+        with self._lock:
+            self.session, self.per_chat, self.loaded = session, per_chat, True
+
+
+    def run_session(self, chat: Chat, again: bool = False) -> None:
+        "Execute session commands that didn't run yet, or all if `again`."
+        with self._lock:
+            if not self.loaded:
+                self.compile()
+
+            cmds = [c for c in self.session if again or c not in self.ran]
+            self.ran.update(cmds)
+
+        for cmd in cmds:
+            eval_f(chat, cmd)
+
+
+    def run_per_chat(self, chat: Chat) -> None:
+        with self._lock:
+            cmds = list(self.per_chat)
+
+        for cmd in cmds:
+            eval_f(chat, cmd)
+
+
+    def on_chat_init(self, chat: Chat) -> None:
+        self.watch()
+        self.run_session(chat)
+        self.run_per_chat(chat)
+
+
+    def reload(self, chat: Chat) -> None:
+        self.compile()
+        self.run_session(chat, again=True)
+        self.run_per_chat(chat)
+
+
+    def reset(self, chat: Chat) -> None:
+        # Overwritten, a removed file wouldn't be created again by
+        # get_autorun_json_path(), which remembers it
+        with self._lock:
+            with AtomicFile(get_autorun_json_path(), "w") as out:
+                out.write(DEFAULT_CONFIG)
+
+        self.reload(chat)
+
+
+    def add_command(self, chat: Chat, command: str) -> None:
+        path = get_autorun_json_path()
+
+        with self._lock:
+            with open(path, "r") as in_file, AtomicFile(path, "w") as out:
+                config: list = json.loads(in_file.read())
+                config.append(command)
+                out.write(json.dumps(config, indent=4, ensure_ascii=False))
+
+            self.session.append(command)
+            self.ran.add(command)
+
+        eval_f(chat, command)
+
 
-    assert isinstance(config, list), \
-           "Content of `autorun.json` must be a JSON list of strings."
+    def watch(self) -> None:
+        """Start watching `autorun.json`, must be called from the GUI thread.
+        Its directory is watched too, to notice when the file is created
+        again after being removed, e.g. by `/autorun --reset`."""
+        if self._watcher:
+            return
 
-    for cmd in config:
-        eval_f(chat, cmd)
+        path          = get_autorun_json_path()
+        self._watcher = QFileSystemWatcher([path, os.path.dirname(path)])
+        self._watcher.fileChanged.connect(self.on_file_change)
+        self._watcher.directoryChanged.connect(
+            lambda _: self.on_directory_change(path)
+        )
 
 
-def add_command(chat, command: str) -> None:
-    path = get_autorun_json_path()
+    def on_directory_change(self, path: str) -> None:
+        # Only the file's reappearance matters, not other files' changes
+        if path not in self._watcher.files() and os.path.exists(path):
+            self.on_file_change(path)
 
-    with open(path, "r") as in_file, AtomicFile(path, "w") as out_file:
-        config: List[str] = json.loads(in_file.read())
-        config.append(command)
-        out_file.write(json.dumps(config, indent=4, ensure_ascii=False))
 
-    load_autorun_json(chat)
+    def on_file_change(self, path: str) -> None:
+        # Removed files, or replaced by an atomic write, aren't watched anymore
+        if path not in self._watcher.files() and os.path.exists(path):
+            self._watcher.addPath(path)
 
+        try:
+            self.compile()
+        except (OSError, ValueError, AssertionError):
+            return  # Being edited, or the error will show on next chat init
 
-def reset_autorun_json(chat) -> None:
-    path = get_autorun_json_path()
-    if os.path.exists(path):
-        os.remove(path)
+        docks = main_window().visible_chat_docks
+        if docks:
+            self.run_session(next(iter(docks.values())).chat)
 
-    load_autorun_json(chat)
 
+AUTORUN = Autorun()
 
-CHAT_INIT_HOOKS["load_autorun_json"] = load_autorun_json
+CHAT_INIT_HOOKS["autorun"] = AUTORUN.on_chat_init
@@ -0,0 +1,62 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import html
+
+from . import register
+from .jobs import COMMAND_QUEUE
+from ..chat import Chat
+
+
+# Not queued, or it would wait for the commands it should cancel
+@register(run_in_thread=False)
+def cancel(chat: Chat, args: dict) -> None:
+    """Usage: /cancel [-a|--all] [-l|--list]
+
+    Cancel commands waiting to run and stop running ones.
+
+    Commands of a chat run one after the other, a slow command like
+    `/shell` delays the ones typed after it.
+    Running commands can only be stopped if they support it, like `/shell`.
+    By default, only commands of the current chat are affected.
+
+    Options:
+      -a, --all
+        Cancel commands of all chats.
+
+      -l, --list
+        Show running and waiting commands instead of cancelling them.
+
+    Examples:
+    ```
+      /cancel
+      /cancel --all
+      /cancel --list --all
+    ```"""
+
+    key = (chat.client.user_id, chat.room.room_id)
+
+    if args["--list"]:
+        list_f(chat, show_all=args["--all"])
+        return
+
+    count = COMMAND_QUEUE.cancel(None if args["--all"] else key)
+    chat.logger.info(f"Cancelled {count} waiting command(s).")
+
+
+def list_f(chat: Chat, show_all: bool = False) -> None:
+    key  = (chat.client.user_id, chat.room.room_id)
+    jobs = [j for j in COMMAND_QUEUE.jobs() if show_all or j[0] == key]
+
+    if not jobs:
+        chat.logger.info("No running or waiting commands.")
+        return
+
+    lines = [
+        f"{html.escape(user_id)} in {html.escape(room_id)}: "
+        f"{html.escape('/' + job.name) if job else 'nothing'} running"
+        f"{f' for {job.running_for:.0f}s' if job else ''}, "
+        f"{waiting} waiting"
+        for (user_id, room_id), job, waiting in jobs
+    ]
+    chat.logger.info("<pre>%s</pre>" % "\n".join(lines), is_html=True)
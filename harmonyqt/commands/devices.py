@@ -3,7 +3,6 @@
 
 import math
 import platform
-from multiprocessing.pool import ThreadPool
 from typing import List, Optional
 
 from PyQt5.QtCore import QDateTime
@@ -15,7 +14,6 @@ from matrix_client.device import Device
 from . import register
 from .. import main_window
 from ..chat import Chat
-from ..utils import get_ip_info
 
 DATE_FORMAT = "yyyy-MM-dd HH:mm:ss"
 
@@ -116,7 +114,7 @@ def device_list(chat: Chat, user_id: str) -> None:
     chat.logger.info("Retrieving devices info...")
     is_own = user_id in main_window().accounts
 
-    chat.client.olm_device.device_list.get_room_device_keys(chat.room)
+    main_window().device_info.ensure_room_keys(chat.client, chat.room)
 
     this: List[OlmDevice] = []
     if is_own:
@@ -136,22 +134,9 @@ def device_list(chat: Chat, user_id: str) -> None:
         chat.logger.error(f"No devices found or unknown user: `{user_id}`.")
         return
 
-    def get_info(device) -> None:
-        device.country = None
-        if is_own:
-            device.get_info()
+    owner = main_window().accounts[user_id] if is_own else chat.client
+    main_window().device_info.fill(owner, this + others)
 
-            if device.device_id == chat.client.device_id and \
-               not device.last_seen_ip or device.last_seen_ip == "-":
-                info                = get_ip_info()
-                device.last_seen_ip = info.get("ip")
-                device.country      = info.get("country")
-
-            elif device.last_seen_ip and device.last_seen_ip != "-":
-                device.country = get_ip_info(device.last_seen_ip)\
-                                 .get("country")
-
-    ThreadPool(8).map(get_info, this + others)
     others.sort(key=lambda d: -d.last_seen_ts if d.last_seen_ts else math.inf)
 
     fmt_name = lambda n: n or f"<em>Un{'set' if is_own else 'known'}</em>"
@@ -206,37 +191,19 @@ def device_set(chat:       Chat,
            "Expected ONE of trust, blacklist or ignore."
 
     def _act_on_device(dev: Device) -> None:
-        print("act 0", dev.user_id, dev.device_id)
-        if blacklist:
-            dev.blacklisted = True
-            dev.verified    = False
-            dev.ignored     = False
-        elif trust:
-            dev.verified    = True
-            dev.blacklisted = False
-            dev.ignored     = False
-        else:
-            dev.ignored     = True
-            dev.verified    = False
-            dev.blacklisted = False
-
-        save_dict = {dev.user_id: {dev.device_id: dev}}
-
-        for cli in main_window().accounts.values():
-            cli.olm_device.db.save_device_keys(save_dict)
-            cli.olm_device.db.load_device_keys(cli.api,
-                                               cli.olm_device.device_keys)
+        main_window().device_info.set_trust(
+            dev, verified=trust, blacklisted=blacklist, ignored=ignore
+        )
 
     for client in main_window().accounts.values():
         if client.device_id == device_id:
             _act_on_device(client.olm_device)
             return
 
-    dev_list = chat.client.olm_device.device_list
-    dev_list.get_room_device_keys(chat.room)
+    main_window().device_info.ensure_room_keys(chat.client, chat.room)
 
     try:
-        dev = dev_list.device_keys[user_id][device_id]
+        dev = chat.client.olm_device.device_keys[user_id][device_id]
     except KeyError:
         chat.logger.error(
             f"User `{user_id}` or device `{device_id}` not found."
@@ -5,10 +5,9 @@ import pdb as actual_pdb
 import shlex
 from typing import Callable, Dict, Optional
 
-import docopt
 from PyQt5.QtCore import pyqtRemoveInputHook
 
-from . import REGISTERED_COMMANDS, register, say
+from . import get_command, register, say
 from .. import main_window
 from ..chat import Chat, RoomNotJoinedError, UserNotLoggedInError
 
@@ -101,7 +100,7 @@ def eval_f(chat:      Chat,
             user_id = f"@{user_id}:{server}"
 
         try:
-            chat = Chat(user_id, chat.room.room_id)
+            chat = main_window().chats.open(user_id, chat.room.room_id)
         except (UserNotLoggedInError, RoomNotJoinedError) as err:
             chat.logger.error(str(err))
             return
@@ -126,9 +125,8 @@ def eval_f(chat:      Chat,
         chat.logger.exception(err)
         return
 
-    try:
-        parse_func = REGISTERED_COMMANDS[func.lstrip("/")]
-    except KeyError:
+    parse_func = get_command(func.lstrip("/"))
+    if not parse_func:
         chat.logger.error(
             f"Command not found: `{func}`. \n"
             f"Type `/help` to see available commands.\n"
@@ -137,8 +135,12 @@ def eval_f(chat:      Chat,
         )
         return
 
+    # Not needed before the first command, slow imports
+    import docopt
+    from .parsing import parse_args
+
     try:
-        args = docopt.docopt(parse_func.__doc__, help=False, argv=args)
+        args = parse_args(parse_func, args)
     except docopt.DocoptExit:
         chat.logger.error(
             f"Invalid command syntax or bad option, "
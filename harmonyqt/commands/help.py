@@ -5,7 +5,7 @@ import re
 from inspect import cleandoc
 from typing import List
 
-from . import REGISTERED_COMMANDS, register
+from . import command_names, get_command, register
 from ..chat import Chat
 
 
@@ -36,12 +36,11 @@ def help_f(chat: Chat, commands: List[str], full: bool = False) -> None:
 
     full     = bool(commands) or full
     show_all = not commands
-    commands = [c.lstrip("/") for c in commands] or sorted(REGISTERED_COMMANDS)
+    commands = [c.lstrip("/") for c in commands] or command_names()
 
     for name in commands:
-        try:
-            func = REGISTERED_COMMANDS[name]
-        except KeyError:
+        func = get_command(name)
+        if not func:
             chat.logger.error(f"Command not found: `{name}`.")
             continue
 
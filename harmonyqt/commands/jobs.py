@@ -0,0 +1,170 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .. import main_window
+from ..chat import Chat
+
+# Seconds after which a running command stops blocking the next commands
+# of its chat. Python threads can't be killed, the command keeps its worker
+# until it returns.
+COMMAND_TIMEOUT = 600
+
+# (user ID, room ID) of the chat that ran a command
+ChatKey = Tuple[str, str]
+
+_CURRENT = threading.local()
+
+
+class CommandJob:
+    def __init__(self, chat: Chat, name: str, func: Callable[[], None]
+                ) -> None:
+        self.chat: Chat    = chat
+        self.key:  ChatKey = (chat.client.user_id, chat.room.room_id)
+        self.name: str     = name
+        self.func          = func
+
+        self.started_at: Optional[float] = None
+        self.timed_out:  bool            = False
+        # Commands that take a long time should stop when this is set
+        self.cancelled = threading.Event()
+
+
+    @property
+    def running_for(self) -> float:
+        return time.monotonic() - self.started_at if self.started_at else 0
+
+
+def current_job() -> Optional[CommandJob]:
+    "Return the job of the command running in this thread, if any."
+    return getattr(_CURRENT, "job", None)
+
+
+class CommandQueue:
+    """Run commands on the application's `Executor`, in order for each chat.
+
+    Commands of different chats run in parallel, limited by the executor's
+    `"command"` kind limit. Waiting commands can be cancelled, and a
+    command running for more than `timeout` seconds doesn't block the next
+    commands of its chat anymore.
+
+    A timed out command still takes a worker and counts against the limit.
+    The limit must stay below the number of workers: commands can wait for
+    other tasks, which would never run if commands took every worker."""
+
+    def __init__(self, timeout: float = COMMAND_TIMEOUT) -> None:
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._queues:  Dict[ChatKey, Deque[CommandJob]] = {}
+        self._running: Dict[ChatKey, CommandJob]        = {}
+        self._watcher: Optional[threading.Thread]       = None
+
+
+    def submit(self, chat: Chat, name: str, func: Callable[[], None]
+              ) -> CommandJob:
+        job = CommandJob(chat, name, func)
+
+        with self._lock:
+            self._queues.setdefault(job.key, Deque()).append(job)
+
+            if job.key not in self._running:
+                self._start_next(job.key)
+
+        return job
+
+
+    def _start_next(self, key: ChatKey) -> None:
+        "Must be called with the lock held."
+        queue = self._queues.get(key)
+
+        if not queue:
+            self._queues.pop(key, None)
+            return
+
+        job                = queue.popleft()
+        self._running[key] = job
+        executor           = main_window().executor
+
+        assert executor.kind_limits.get("command", executor.workers) < \
+               executor.workers, "Commands could take all executor workers"
+
+        executor.submit(self._run, job, kind="command")
+
+        if not self._watcher:
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+
+    def _run(self, job: CommandJob) -> None:
+        _CURRENT.job   = job
+        job.started_at = time.monotonic()
+
+        try:
+            if not job.cancelled.is_set():
+                job.func()
+        finally:
+            _CURRENT.job = None
+
+            with self._lock:
+                if self._running.get(job.key) is job:  # didn't time out
+                    del self._running[job.key]
+                    self._start_next(job.key)
+
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(1)
+            timed_out: List[CommandJob] = []
+
+            with self._lock:
+                if not self._running:
+                    self._watcher = None
+                    return
+
+                for key, job in list(self._running.items()):
+                    if job.running_for > self.timeout:
+                        job.timed_out = True
+                        job.cancelled.set()
+                        timed_out.append(job)
+                        del self._running[key]
+                        self._start_next(key)
+
+            for job in timed_out:
+                job.chat.logger.error(
+                    f"`/{job.name}` is taking more than {self.timeout}s, "
+                    f"next commands of this chat won't wait for it anymore."
+                )
+
+
+    def cancel(self, key: Optional[ChatKey] = None) -> int:
+        """Cancel waiting commands and ask running ones to stop, for the
+        chat `key` or all chats. Return the number of waiting commands
+        cancelled."""
+        with self._lock:
+            keys  = [key] if key else list(self._queues) + list(self._running)
+            count = 0
+
+            for k in set(keys):
+                for job in self._queues.pop(k, ()):
+                    job.cancelled.set()
+                    count += 1
+
+                if k in self._running:
+                    self._running[k].cancelled.set()
+
+            return count
+
+
+    def jobs(self) -> List[Tuple[ChatKey, Optional[CommandJob], int]]:
+        "Return (chat key, running job, number of waiting jobs) tuples."
+        with self._lock:
+            keys = set(self._queues) | set(self._running)
+            return [(k, self._running.get(k), len(self._queues.get(k, ())))
+                    for k in sorted(keys)]
+
+
+COMMAND_QUEUE = CommandQueue()
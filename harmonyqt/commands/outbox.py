@@ -0,0 +1,71 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import html
+
+from . import register
+from .. import main_window
+from ..chat import Chat
+
+
+@register
+def outbox(chat: Chat, args: dict) -> None:
+    """Usage: /outbox [-a|--all]
+
+    Show queued messages and sending statistics.
+
+    Every account has its own send queue for each room, messages from
+    different rooms or accounts are sent in parallel.
+    By default, only the queue for the current room and user is shown.
+
+    Options:
+      -a, --all
+        Show queues of all rooms and accounts that sent messages
+        since Harmony was started, or have messages waiting to be sent.
+
+    Examples:
+    ```
+      /outbox
+      /outbox --all
+    ```"""
+
+    outbox_f(chat=chat, show_all=args["--all"])
+
+
+def outbox_f(chat: Chat, show_all: bool = False) -> None:
+    box = main_window().outbox
+
+    with box.lock:
+        pipelines = [
+            p for (user_id, room_id), p in box.pipelines.items()
+            if show_all or (user_id == chat.client.user_id and
+                            room_id == chat.room.room_id)
+        ]
+
+    if not pipelines:
+        chat.logger.info("No messages sent or queued yet.")
+        return
+
+    def room_name(user_id: str, room_id: str) -> str:
+        client = main_window().accounts.get(user_id)
+        room   = client.rooms.get(room_id) if client else None
+        return html.escape(room.display_name if room else room_id)
+
+    infos = [{
+        "Room:":        room_name(p.user_id, p.room_id),
+        "User:":        html.escape(p.user_id),
+        "Queued:":      f"{len(p.queue)}{' (sending)' if p.running else ''}",
+        "Sent:":        f"{p.stats.sent} ({p.stats.throughput:.1f}/min)",
+        "Failed:":      str(p.stats.failed),
+        "Retries:":     str(p.stats.retries),
+        "Avg. delay:":  f"{p.stats.avg_latency:.2f}s",
+        "Last delay:":  f"{p.stats.last_latency:.2f}s",
+    } for p in pipelines]
+
+    max_k = len(max(infos[0].keys(), key=len))
+    text  = "\n\n".join((
+        ("\n".join((f"{k:{max_k}} {v}" for k, v in i.items())))
+        for i in infos
+    ))
+
+    chat.logger.info(f"<pre>{text}</pre>", is_html=True)
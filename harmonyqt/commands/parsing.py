@@ -0,0 +1,84 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+from copy import copy
+from threading import Lock
+from typing import Any, Dict, Optional, Sequence
+
+from docopt import (
+    AnyOptions, DocoptExit, Option, TokenStream, formal_usage,
+    parse_argv, parse_defaults, parse_pattern, printable_usage
+)
+
+from . import FuncType
+
+
+class UsageParser:
+    """Parser for a command's docopt usage docstring.
+
+    `docopt.docopt()` parses the usage and options sections again for every
+    call. Here, this is done once, only the arguments are parsed by
+    `parse()`. The result of running a command without arguments is
+    also kept."""
+
+    def __init__(self, doc: str) -> None:
+        usage        = printable_usage(doc)
+        self.options = parse_defaults(doc)
+        self.pattern = parse_pattern(formal_usage(usage), self.options)
+
+        # Setup [options] shortcuts, which stand for all options not
+        # explicitly in the usage patterns
+        pattern_options = set(self.pattern.flat(Option))
+        for any_options in self.pattern.flat(AnyOptions):
+            any_options.children = list(set(self.options) - pattern_options)
+
+        self.pattern = self.pattern.fix()
+        self._no_argv_result: Optional[Dict[str, Any]] = None
+
+
+    def parse(self, argv: Sequence[str]) -> Dict[str, Any]:
+        "Return the args dict for `argv`, like `docopt.docopt()` would."
+        if not argv and self._no_argv_result is not None:
+            return self._copy(self._no_argv_result)
+
+        # parse_argv() can add unknown options to the list
+        tokens = TokenStream(list(argv), DocoptExit)
+        parsed = parse_argv(tokens, list(self.options), False)
+
+        matched, left, collected = self.pattern.match(parsed)
+        if not matched or left:
+            raise DocoptExit()
+
+        result = {a.name: a.value for a in self.pattern.flat() + collected}
+
+        if not argv:
+            self._no_argv_result = result
+
+        return self._copy(result)
+
+
+    @staticmethod
+    def _copy(result: Dict[str, Any]) -> Dict[str, Any]:
+        # Default values of repeatable arguments are lists from the pattern
+        return {k: copy(v) for k, v in result.items()}
+
+
+_PARSERS: Dict[FuncType, UsageParser] = {}
+_LOCK = Lock()
+
+
+def parse_args(func: FuncType, argv: Sequence[str]) -> Dict[str, Any]:
+    """Parse `argv` for a command, using a parser compiled the first time
+    the command is used.
+
+    Raises `docopt.DocoptExit` for invalid arguments, and
+    `docopt.DocoptLanguageError` for invalid usage docstrings."""
+
+    with _LOCK:
+        parser = _PARSERS.get(func)
+
+        if not parser:
+            parser = _PARSERS[func] = UsageParser(func.__doc__)
+
+    return parser.parse(argv)
+
@@ -1,14 +1,10 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv3.
 
-import threading
-
 from . import register
 from ..chat import Chat
 from ..message import Message
 
-SEND_LOCK = threading.Lock()
-
 
 @register
 def say(chat: Chat, args: dict) -> None:
@@ -52,7 +48,5 @@ def say_f(chat: Chat, text: str, is_html: bool = False, echo: bool = False
         html      = text if is_html     else "",
     )
 
-    # Prevent mixing up if user sends msg B before msg A is received
-    # by the server:
-    with SEND_LOCK:
-        msg.send()
+    # Messages are queued and sent in order for each room by the outbox
+    msg.send()
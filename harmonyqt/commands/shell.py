@@ -1,13 +1,28 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv3.
 
+import codecs
+import os
 import re
+import signal
 import subprocess as sp
-from typing import Union
+from threading import Lock, Thread
+from typing import BinaryIO, Optional, Union
+from uuid import uuid4
 
 from . import register, say
+from .jobs import current_job
 from ..chat import Chat
 
+# Seconds between updates of the output shown while a command runs
+UPDATE_INTERVAL = 0.25
+
+# Characters kept from the end of stdout and stderr, older output is dropped
+MAX_OUTPUT = 32 * 1024
+
+# Bytes read at once from the outputs
+CHUNK_SIZE = 64 * 1024
+
 
 @register
 def shell(chat: Chat, args: dict) -> None:
@@ -17,12 +32,16 @@ def shell(chat: Chat, args: dict) -> None:
 
     Run a `COMMAND` with the OS shell, send standard output.
 
+    While the command runs, its output is shown and updated locally.
+    It can be stopped with `/cancel`.
+
     When the command finishes,
     - Its return code will be shown if it isn't `0`
     - stderr will be shown if it contains anything
     - stdout will be shown/sent if the command outputted anything.
 
     ANSI escape codes are stripped from outputs.
+    Only the last 32768 characters of stdout and stderr are kept.
 
     Options:
       -e, --echo
@@ -59,33 +78,127 @@ def shell_f(chat:          Chat,
             no_command:    bool          = False,
             no_code_block: bool          = False) -> None:
 
+    # New session: cancelling kills the shell and the processes it started
     process = sp.Popen(
         command, shell=True, stdout=sp.PIPE, stderr=sp.PIPE,
+        start_new_session=True,
     )
-    stdout, stderr = process.communicate()
-    retcode        = process.returncode
+    stdout = OutputTail(process.stdout)
+    stderr = OutputTail(process.stderr)
 
-    command = _treat_output(command)
-    stdout  = _treat_output(stdout)
-    stderr  = _treat_output(stderr)
+    job       = current_job()
+    block_id  = f"shell-{uuid4()}"
+    shown     = ""
+    cancelled = False
+    command   = _treat_output(command)
 
-    if retcode and retcode != 0:
-        chat.logger.warning(f"`{command}` returned `{retcode}`.")
-
-    if stderr:
-        chat.logger.warning(f"```\n{stderr}\n```")
-
-    if stdout:
+    def format_output(output: str) -> str:
         bticks = ("", "") if no_code_block else ("```\n", "\n```")
-        text   = "\n".join((
+        return "\n".join((
             bticks[0] if no_command else f"{bticks[0]}$ {command}",
-            f"{stdout}{bticks[1]}"
+            f"{output}{bticks[1]}"
         ))
 
-        if echo:
-            chat.logger.info(text)
+    # Show the output received so far, until the process closes its outputs
+    while stdout.reading or stderr.reading:
+        # Joining a finished reader would return at once and spin
+        (stdout if stdout.reading else stderr).join(UPDATE_INTERVAL)
+
+        if not cancelled and job and job.cancelled.is_set():
+            _kill(process)
+            cancelled = True
+
+        output = _treat_output(stdout.text)
+        if output != shown:
+            chat.logger.block(block_id, format_output(output))
+            shown = output
+
+    retcode = process.wait()
+    output  = _treat_output(stdout.text)
+    errors  = _treat_output(stderr.text)
+
+    if cancelled:
+        chat.logger.warning(f"`{command}` was cancelled.")
+    elif retcode and retcode != 0:
+        chat.logger.warning(f"`{command}` returned `{retcode}`.")
+
+    if errors:
+        chat.logger.warning(f"```\n{errors}\n```")
+
+    if stdout.dropped or stderr.dropped:
+        chat.logger.warning(
+            f"`{command}` outputted too much, only the last "
+            f"{MAX_OUTPUT} characters of its outputs were kept."
+        )
+
+    if echo or cancelled:
+        if output:
+            chat.logger.block(block_id, format_output(output), last=True)
+        return
+
+    if shown:
+        chat.logger.block(block_id, f"Output of `{command}` sent.", last=True)
+
+    if output:
+        say.say_f(chat, format_output(output))
+
+
+class OutputTail:
+    """Read a process output in a thread as it comes,
+    keep its last `max_chars` characters."""
+
+    def __init__(self, stream: BinaryIO, max_chars: int = MAX_OUTPUT) -> None:
+        self.max_chars: int = max_chars
+        self.dropped:   int = 0  # number of characters not kept
+
+        self._text    = ""
+        self._lock    = Lock()
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._thread  = Thread(target=self._read, args=(stream,), daemon=True)
+        self._thread.start()
+
+
+    @property
+    def text(self) -> str:
+        with self._lock:
+            return self._text
+
+
+    @property
+    def reading(self) -> bool:
+        return self._thread.is_alive()
+
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+
+    def _read(self, stream: BinaryIO) -> None:
+        with stream:
+            for chunk in iter(lambda: stream.read1(CHUNK_SIZE), b""):
+                self._add(self._decoder.decode(chunk))
+
+        self._add(self._decoder.decode(b"", final=True))
+
+
+    def _add(self, text: str) -> None:
+        with self._lock:
+            self._text += text
+            excess      = len(self._text) - self.max_chars
+
+            if excess > 0:
+                self._text    = self._text[excess:]
+                self.dropped += excess
+
+
+def _kill(process: sp.Popen) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
         else:
-            say.say_f(chat, text)
+            process.kill()
+    except OSError:  # already dead
+        pass
 
 
 def _treat_output(text: Union[bytes, str]) -> str:
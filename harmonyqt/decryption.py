@@ -0,0 +1,196 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from PyQt5.QtCore import Qt
+
+from matrix_client.client import MatrixClient
+from matrix_client.errors import (
+    MegolmDecryptMissingKeysError, RoomEventDecryptError
+)
+
+from . import main_window
+
+# Max number of sessions for which undecryptable events are remembered
+MAX_PENDING_SESSIONS = 256
+
+# Max number of undecryptable events remembered per session
+MAX_PENDING_EVENTS = 500
+
+# (user ID, Megolm session ID)
+SessionKey = Tuple[str, str]
+
+# (user ID, room ID, sender key, Megolm session ID)
+SessionLockKey = Tuple[str, str, str, str]
+
+
+class Decryptor:
+    """Decrypt events in parallel, retry undecryptable ones later.
+
+    Encrypted events returned by `/messages`, e.g. for
+    `Room.backfill_previous_messages()`, are decrypted on the application's
+    `Executor` before matrix_client processes them, one task per Megolm
+    session.
+
+    An inbound session and its replay records can't be used by two threads
+    at once. Every decryption of an account, including the sync thread's,
+    holds a lock for the event's session.
+
+    Events that couldn't be decrypted because their session's key is
+    missing are remembered, and decrypted again as soon as the key arrives.
+    The decrypted messages are then emitted again with
+    `EventManager.signals.new_message`, and replace the decryption errors
+    shown in chats."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._pending: "OrderedDict[SessionKey, Deque[dict]]" = OrderedDict()
+        self._session_locks: Dict[SessionLockKey, Lock] = {}
+
+        acc_sig = main_window().accounts.signals
+        # Hooks must be in place before the first sync
+        acc_sig.login.connect(self.add_account, Qt.DirectConnection)
+        acc_sig.logout.connect(self.forget_account)
+        acc_sig.decrypt_error.connect(self.on_decrypt_error,
+                                      Qt.DirectConnection)
+
+
+    def add_account(self, client: MatrixClient) -> None:
+        """Make `client` decrypt events with the session locks, pre-decrypt
+        `/messages` responses in parallel, and retry decrypting events when
+        it gets new Megolm sessions."""
+        olm          = client.olm_device
+        original     = olm.megolm_add_inbound_session
+        decrypt      = olm.megolm_decrypt_event
+        get_messages = client.api.get_room_messages
+
+        def megolm_decrypt_event(event: dict) -> Optional[dict]:
+            with self._session_lock(client.user_id, event):
+                return decrypt(event)
+
+        def get_room_messages(room_id: str, *args, **kwargs
+                             ) -> Dict[str, Any]:
+            response = get_messages(room_id, *args, **kwargs)
+            self.decrypt_many(client, response.get("chunk", []))
+            return response
+
+        def add_inbound_session(room_id: str, sender_key: str,
+                                signing_key: str, session_id: str,
+                                *args, **kwargs) -> bool:
+            new = original(room_id, sender_key, signing_key, session_id,
+                           *args, **kwargs)
+            # Also if the session was only loaded from the database
+            self.retry(client, session_id)
+            return new
+
+        olm.megolm_decrypt_event       = megolm_decrypt_event
+        olm.megolm_add_inbound_session = add_inbound_session
+        client.api.get_room_messages   = get_room_messages
+
+
+    def _session_lock(self, user_id: str, event: dict) -> Lock:
+        content = event.get("content", {})
+        key     = (user_id, event.get("room_id", ""),
+                   content.get("sender_key", ""),
+                   content.get("session_id", ""))
+
+        with self._lock:
+            return self._session_locks.setdefault(key, Lock())
+
+
+    def on_decrypt_error(self, user_id: str, err: RoomEventDecryptError
+                        ) -> None:
+        if not isinstance(err.original_exception,
+                          MegolmDecryptMissingKeysError):
+            return
+
+        key = (user_id, err.event["content"]["session_id"])
+
+        with self._lock:
+            if key not in self._pending:
+                self._pending[key] = Deque(maxlen=MAX_PENDING_EVENTS)
+
+                while len(self._pending) > MAX_PENDING_SESSIONS:
+                    self._pending.popitem(last=False)
+
+            self._pending[key].append(err.event)
+
+
+    def retry(self, client: MatrixClient, session_id: str) -> None:
+        with self._lock:
+            events = self._pending.pop((client.user_id, session_id), None)
+
+        if events:
+            main_window().executor.submit(
+                self._retry_session, client, list(events), kind="decrypt"
+            )
+
+
+    def _retry_session(self, client: MatrixClient, events: List[dict]
+                      ) -> None:
+        for event in self._decrypt_session(client, events):
+            if event and event["type"] == "m.room.message":
+                main_window().events.on_new_message(client.user_id, event)
+
+
+    @staticmethod
+    def _decrypt_session(client: MatrixClient, events: List[dict]
+                        ) -> List[Optional[dict]]:
+        """Decrypt `events` of the same session. Return the decrypted events,
+        or None for those that couldn't be decrypted.
+
+        Events from verified devices are returned as new `VerifiedEvent`
+        dicts, the others are decrypted in place."""
+        decrypted: List[Optional[dict]] = []
+
+        for event in events:
+            try:
+                decrypted.append(
+                    client.olm_device.megolm_decrypt_event(event) or None
+                )
+            except Exception:  # pylint: disable=broad-except
+                # matrix_client will report the error again if needed
+                decrypted.append(None)
+
+        return decrypted
+
+
+    def decrypt_many(self, client: MatrixClient, events: List[dict]) -> None:
+        """Decrypt encrypted `events` in parallel when possible, replace
+        them in the list by their decrypted version."""
+        sessions: Dict[str, List[int]] = {}
+
+        for i, event in enumerate(events):
+            if event["type"] == "m.room.encrypted" and \
+               "session_id" in event["content"]:
+                sessions.setdefault(event["content"]["session_id"], []) \
+                        .append(i)
+
+        def decrypt(idx: List[int]) -> List[Optional[dict]]:
+            return self._decrypt_session(client, [events[i] for i in idx])
+
+        indexes = list(sessions.values())
+
+        if len(indexes) > 1:
+            results = main_window().executor.map(decrypt, indexes,
+                                                 kind="decrypt")
+        else:
+            results = [decrypt(idx) for idx in indexes]
+
+        for idx, decrypted in zip(indexes, results):
+            for i, event in zip(idx, decrypted):
+                if event is not None:
+                    events[i] = event
+
+
+    def forget_account(self, user_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._pending if k[0] == user_id]:
+                del self._pending[key]
+
+            for lock_key in [k for k in self._session_locks
+                             if k[0] == user_id]:
+                del self._session_locks[lock_key]
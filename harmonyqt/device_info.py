@@ -0,0 +1,290 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import json
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+from atomicfile import AtomicFile
+from PyQt5.QtCore import QStandardPaths
+
+from matrix_client.client import MatrixClient
+from matrix_client.device import Device
+from matrix_client.room import Room
+
+from . import main, main_window
+from .executor import HIGH
+from .hooks import Hook
+from .utils import get_ip_info, get_standard_path
+
+# Seconds during which the country found for an IP is reused
+IP_INFO_TTL = 7 * 24 * 3600
+
+# Our own IP can change when switching networks
+OWN_IP_TTL = 600
+
+# Failed lookups aren't retried before that many seconds
+FAILED_TTL = 3600
+
+# Takes an IP, or None for our own IP; returns a dict that may have
+# "ip" and "country" keys, or an empty dict if the lookup failed
+IPResolver = Callable[[Optional[str]], Dict[str, str]]
+
+# {"ip": ..., "country": ... if found, "time": lookup timestamp}
+IPInfo = Dict[str, Any]
+
+
+def offline_resolver(_: Optional[str] = None) -> Dict[str, str]:
+    "Resolver that never finds anything, for when network isn't wanted."
+    return {}
+
+
+class IPInfoCache:
+    """Countries of IP addresses, saved to disk.
+
+    Lookups are done by `resolver` only when an IP is unknown or its
+    result is older than the TTL. Our own IP is cached under the `""` key."""
+
+    def __init__(self,
+                 path:     str        = "",
+                 resolver: IPResolver = get_ip_info,
+                 ttl:      float      = IP_INFO_TTL) -> None:
+        self.path     = path
+        self.resolver = resolver
+        self.ttl      = ttl
+
+        self._lock = Lock()
+        self._infos: Optional[Dict[str, IPInfo]] = None
+        self._changed = False
+
+
+    def _load(self) -> Dict[str, IPInfo]:
+        "Must be called with the lock held."
+        if self._infos is not None:
+            return self._infos
+
+        if not self.path:
+            self.path = get_standard_path(
+                QStandardPaths.AppCacheLocation, "ip_info.json", "{}"
+            )
+
+        try:
+            with open(self.path, "r") as file:
+                self._infos = json.loads(file.read().strip() or "{}")
+        except (OSError, ValueError):
+            self._infos = {}
+
+        return self._infos
+
+
+    def load(self) -> None:
+        "Read the cache file now instead of on the first lookup."
+        with self._lock:
+            self._load()
+
+
+    def _expired(self, key: str, info: IPInfo) -> bool:
+        ttl = OWN_IP_TTL if not key else \
+              FAILED_TTL if not info.get("country") else \
+              self.ttl
+        return time.time() - info.get("time", 0) > ttl
+
+
+    def lookup(self, ip: Optional[str] = None) -> IPInfo:
+        "Return the cached or newly found info for `ip` or our own IP."
+        key = ip or ""
+
+        with self._lock:
+            info = self._load().get(key)
+
+        if info is not None and not self._expired(key, info):
+            return info
+
+        found = self.resolver(ip)
+        info  = {"ip": found.get("ip", key), "time": time.time()}
+        if found.get("country"):
+            info["country"] = found["country"]
+
+        with self._lock:
+            self._load()[key] = info
+            self._changed     = True
+
+        return info
+
+
+    def lookup_many(self, ips: Iterable[Optional[str]]
+                   ) -> Dict[str, IPInfo]:
+        """Look up IPs in parallel on the application's `Executor`, save the
+        cache if anything new was found. Return `{ip or "": info}`."""
+        keys  = sorted({ip or "" for ip in ips})
+        infos = main_window().executor.map(
+            self.lookup, [k or None for k in keys],
+            kind="device_info", priority=HIGH,
+        )
+        self.save()
+        return dict(zip(keys, infos))
+
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._changed:
+                return
+
+            with AtomicFile(self.path, "w") as new:
+                new.write(json.dumps(self._infos, indent=4))
+
+            self._changed = False
+
+
+class DeviceInfoService:
+    """Fill `Device` objects with their metadata and last seen country,
+    keep device keys and trust of every account up to date."""
+
+    def __init__(self, ip_cache: Optional[IPInfoCache] = None) -> None:
+        self.ip_cache: IPInfoCache = ip_cache or IPInfoCache()
+
+
+    @staticmethod
+    def fetch_own(client: MatrixClient, devices: Sequence[Device]) -> None:
+        """Set the name and last seen IP/time of our `devices` with a single
+        `/devices` request, instead of one request per device."""
+        infos = {d["device_id"]: d for d in
+                 client.api.get_devices().get("devices", [])}
+
+        for device in devices:
+            info                = infos.get(device.device_id, {})
+            device.display_name = info.get("display_name")
+            device.last_seen_ip = info.get("last_seen_ip")
+            device.last_seen_ts = info.get("last_seen_ts")
+
+
+    def fill(self, client: MatrixClient, devices: Sequence[Device]) -> None:
+        """Set the `country` attribute of `devices`.
+        For our own devices, first fetch their info with `fetch_own()`.
+        Our current device's last seen IP is our public IP if the
+        server doesn't know it."""
+        for device in devices:
+            device.country = None
+
+        if not devices or devices[0].user_id != client.user_id:
+            return
+
+        self.fetch_own(client, devices)
+
+        def ip_of(device: Device) -> Optional[str]:
+            if device.last_seen_ip and device.last_seen_ip != "-":
+                return device.last_seen_ip
+            return None
+
+        this  = [d for d in devices if d.device_id == client.device_id]
+        known = [d for d in devices if ip_of(d)]
+        ips   = [ip_of(d) for d in known]
+
+        if this and not ip_of(this[0]):
+            ips.append(None)
+
+        infos = self.ip_cache.lookup_many(ips)
+
+        for device in known:
+            device.country = infos[ip_of(device)].get("country")
+
+        if this and not ip_of(this[0]):
+            this[0].last_seen_ip = infos[""].get("ip") or None
+            this[0].country      = infos[""].get("country")
+
+
+    @staticmethod
+    def ensure_room_keys(client: MatrixClient, room: Room) -> None:
+        """Make sure the device keys of `room`'s members are loaded.
+
+        matrix_client keeps the keys of tracked users up to date using the
+        `device_lists.changed` of sync responses. The database and server
+        are only asked for keys when some members aren't tracked yet."""
+        dev_list = client.olm_device.device_list
+        # pylint: disable=protected-access
+        members  = set(room._members)
+
+        with dev_list.thread_condition:
+            all_tracked = members and members <= dev_list.tracked_user_ids
+
+        if all_tracked:
+            # Wait for updates triggered by a sync to be downloaded
+            dev_list.update_thread.event.wait()
+        else:
+            dev_list.get_room_device_keys(room)
+
+
+    @staticmethod
+    def _apply_trust(client:      MatrixClient,
+                     devices:     Sequence[Device],
+                     verified:    bool = False,
+                     blacklisted: bool = False,
+                     ignored:     bool = False) -> None:
+        """Set the trust of `client`'s copies of `devices` in memory,
+        save them to `client`'s database in a single transaction.
+        Only that database is locked, other accounts aren't blocked.
+
+        Setting the `Device` properties would save the device once per
+        property, and the keys would have to be loaded again."""
+        olm                                 = client.olm_device
+        saved: Dict[str, Dict[str, Device]] = {}
+
+        with main_window().accounts.db_locks.hold(client.user_id):
+            for device in devices:
+                copies = olm.device_keys.setdefault(device.user_id, {})
+
+                if device.device_id == olm.device_id:
+                    same = olm
+                elif device.device_id in copies:
+                    same = copies[device.device_id]
+                else:
+                    same = copies[device.device_id] = Device(
+                        client.api, device.user_id, device.device_id,
+                        database       = olm.db,
+                        ed25519_key    = device.ed25519,
+                        curve25519_key = device.curve25519,
+                    )
+
+                # pylint: disable=protected-access
+                same._verified, same._blacklisted, same._ignored = \
+                    verified, blacklisted, ignored
+
+                saved.setdefault(device.user_id, {})[device.device_id] = same
+
+            if saved:
+                olm.db.save_device_keys(saved)
+
+
+    def set_trust(self,
+                  device:      Device,
+                  verified:    bool = False,
+                  blacklisted: bool = False,
+                  ignored:     bool = False) -> None:
+        "Set the trust of `device` for all our accounts."
+        for client in main_window().accounts.values():
+            self._apply_trust(client, [device], verified, blacklisted, ignored)
+
+
+    def trust_our_accounts(self, client: MatrixClient) -> None:
+        """Make `client`'s device and the devices of our other accounts
+        trust each other.
+
+        `client`'s database gets one transaction with all our devices, and
+        the other accounts' databases one with `client`'s device only.
+        Nothing needs to be loaded again."""
+        others = [c for c in main_window().accounts.values()
+                  if c.user_id != client.user_id]
+
+        self._apply_trust(
+            client, [client.olm_device] + [c.olm_device for c in others],
+            verified=True,
+        )
+
+        for other in others:
+            self._apply_trust(other, [client.olm_device], verified=True)
+
+
+main.HOOKS_INIT_2_BEFORE_LOGIN["Load IP info cache"] = Hook(
+    lambda win: win.device_info.ip_cache.load(), gui=False
+)
@@ -2,7 +2,6 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import json
-from multiprocessing.pool import ThreadPool
 
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtWidgets import QLabel
@@ -11,6 +10,7 @@ from matrix_client.errors import MatrixRequestError
 
 from . import base
 from .. import main_window
+from ..executor import HIGH
 
 
 class CreateRoom(base.GridDialog):
@@ -19,7 +19,6 @@ class CreateRoom(base.GridDialog):
 
     def __init__(self, for_user_id: str = "") -> None:
         super().__init__("Create room")
-        self._pool = ThreadPool(8)
         self.room_created_signal.connect(self.on_room_created)
 
         logged_in = sorted(main_window().accounts.keys())
@@ -133,7 +132,8 @@ class CreateRoom(base.GridDialog):
             client.join_room(room.room_id)
             self.room_created_signal.emit(client.user_id, room.room_id)
 
-        self._pool.apply_async(create, error_callback=self.on_error)
+        main_window().executor.submit(create, priority=HIGH,
+                                      error_callback=self.on_error)
 
 
     def on_error(self, err: BaseException) -> None:
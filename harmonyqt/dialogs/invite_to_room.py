@@ -2,7 +2,6 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import json
-from multiprocessing.pool import ThreadPool
 from typing import Set
 
 from PyQt5.QtCore import pyqtSignal
@@ -12,6 +11,7 @@ from matrix_client.room import Room
 
 from . import base
 from .. import main_window
+from ..executor import HIGH
 
 
 class InviteToRoom(base.GridDialog):
@@ -21,7 +21,6 @@ class InviteToRoom(base.GridDialog):
     def __init__(self, room: Room, as_user: str = "") -> None:
         super().__init__()
         self.room  = room
-        self._pool = ThreadPool(8)
         self.update_wintitle()
 
         us_in_room = {i for i in main_window().accounts if i in room.members}
@@ -115,8 +114,10 @@ class InviteToRoom(base.GridDialog):
         def done(_) -> None:
             self.invites_sent_signal.emit()
 
-        self._pool.map_async(send, invitees,
-                             callback=done, error_callback=self.on_error)
+        main_window().executor.map_async(
+            send, invitees,
+            priority=HIGH, callback=done, error_callback=self.on_error
+        )
 
 
     def on_error(self, err: BaseException) -> None:
@@ -1,8 +1,6 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv3.
 
-from multiprocessing.pool import ThreadPool
-
 from PyQt5.QtCore import Qt, pyqtSignal
 
 from matrix_client.errors import (
@@ -11,6 +9,7 @@ from matrix_client.errors import (
 
 from . import base
 from .. import main_window
+from ..executor import HIGH
 
 
 class Login(base.GridDialog):
@@ -18,7 +17,6 @@ class Login(base.GridDialog):
 
     def __init__(self) -> None:
         super().__init__("Login")
-        self._pool = ThreadPool(1)
 
         self.info_line = base.InfoLine(self)
         self.server    = base.Field(
@@ -66,14 +64,13 @@ class Login(base.GridDialog):
     def validate(self, _) -> None:
         self.info_line.set_info("Logging in...")
 
-        self._pool.apply_async(
-            func = main_window().accounts.login,
-            kwds = {
-                "server_url":    self.server.get_text(),
-                "user_id":       self.username.get_text(),
-                "password":      self.password.get_text(),
-                "add_to_config": self.remember.isChecked(),
-            },
+        main_window().executor.submit(
+            main_window().accounts.login,
+            server_url     = self.server.get_text(),
+            user_id        = self.username.get_text(),
+            password       = self.password.get_text(),
+            add_to_config  = self.remember.isChecked(),
+            priority       = HIGH,
             callback       = lambda *_: self.login_done_signal.emit(),
             error_callback = self.on_error,
         )
@@ -0,0 +1,235 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import heapq
+from threading import RLock
+from typing import Dict, List, Optional, Set, Tuple
+
+from cachetools import LRUCache
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from matrix_client.client import MatrixClient
+from matrix_client.room import Room
+
+from . import main_window
+from .executor import NORMAL
+
+# Max number of names remembered for users that aren't in a cached room
+SENDER_CACHE_SIZE = 4096
+
+
+class _SignalObject(QObject):
+    # User ID, display name found by a profile lookup
+    sender_resolved = pyqtSignal(str, str)
+
+
+class RoomNames:
+    """Name, canonical alias and member names of a room, without our own
+    account. Like `Room.display_name`, but member changes are O(1) and the
+    two member names needed for unnamed rooms are only searched when they
+    may have changed."""
+
+    def __init__(self, own_user_id: str, room: Room) -> None:
+        self.own_user_id = own_user_id
+        self.name:  str  = room.name or ""
+        self.alias: str  = room.canonical_alias or ""
+
+        # pylint: disable=protected-access
+        self.members: Dict[str, str] = {
+            user_id: room.members_displaynames.get(user_id) or user_id
+            for user_id in room._members if user_id != own_user_id
+        }
+
+        self._heroes: Optional[List[str]] = None
+
+
+    @property
+    def display_name(self) -> str:
+        if self.name:
+            return self.name
+
+        if self.alias:
+            return self.alias
+
+        if self._heroes is None:
+            self._heroes = heapq.nsmallest(2, self.members.values())
+
+        heroes, count = self._heroes, len(self.members)
+
+        if count == 1:
+            return heroes[0]
+        if count == 2:
+            return f"{heroes[0]} and {heroes[1]}"
+        if count > 2:
+            return f"{heroes[0]} and {count - 1} others"
+        return "Empty room"
+
+
+    def set_member(self, user_id: str, name: str) -> None:
+        old                   = self.members.get(user_id)
+        self.members[user_id] = name
+        heroes                = self._heroes
+
+        if heroes is not None and \
+           (old in heroes or len(heroes) < 2 or name < heroes[-1]):
+            self._heroes = None
+
+
+    def del_member(self, user_id: str) -> None:
+        old = self.members.pop(user_id, None)
+
+        if self._heroes is not None and old in self._heroes:
+            self._heroes = None
+
+
+class DisplayNames:
+    """Cache of room names, our accounts' and message senders' names.
+
+    Room entries are created from the current room state when first needed,
+    then updated from the state events passed to `on_state_event()` by the
+    `EventManager`. Account names are requested once, then updated from
+    `account_change` signals.
+
+    `sender_name()` never waits for the network: unknown users are returned
+    as their ID while their profile is requested in the background,
+    `signals.sender_resolved` is emitted when the name is found."""
+
+    def __init__(self) -> None:
+        self.signals = _SignalObject()
+        self._lock   = RLock()
+        # {(user_id, room_id): names}
+        self._rooms: Dict[Tuple[str, str], RoomNames] = {}
+        # {user_id: display name}
+        self._users: Dict[str, str] = {}
+        # {user_id: display name} for members seen in any room and profiles
+        self._senders: LRUCache = LRUCache(maxsize=SENDER_CACHE_SIZE)
+        self._resolving: Set[str] = set()
+
+        ev_sig = main_window().events.signals
+        ev_sig.left_room.connect(self.forget_room)
+        ev_sig.account_gone.connect(self.forget_account)
+        ev_sig.account_change.connect(self.on_account_change)
+
+
+    def room_name(self, client: MatrixClient, room: Room) -> str:
+        # Rooms we are only invited to aren't in client.rooms
+        room = client.rooms.get(room.room_id, room)
+        key  = (client.user_id, room.room_id)
+
+        with self._lock:
+            if key not in self._rooms:
+                self._rooms[key] = RoomNames(client.user_id, room)
+
+            return self._rooms[key].display_name
+
+
+    def user_name(self, client: MatrixClient) -> str:
+        "Return the global display name of one of our accounts."
+        with self._lock:
+            if client.user_id in self._users:
+                return self._users[client.user_id]
+
+        name = client.user.get_display_name()
+
+        with self._lock:
+            return self._users.setdefault(client.user_id, name)
+
+
+    def sender_name(self, user_id: str, room_id: str = "") -> str:
+        "Return the name to show for `user_id` in `room_id`, without waiting."
+        accounts = main_window().accounts
+
+        with self._lock:
+            for client in accounts.values():
+                room = client.rooms.get(room_id)
+                # Not in room cache if it's one of our accounts
+                name = room and room.members_displaynames.get(user_id)
+                if name:
+                    return name
+
+                names = self._rooms.get((client.user_id, room_id))
+                name  = names and names.members.get(user_id)
+                if name:
+                    return name
+
+            name = self._senders.get(user_id) or self._users.get(user_id)
+            if name:
+                return name
+
+            if user_id in self._resolving or not accounts:
+                return user_id
+
+            self._resolving.add(user_id)
+
+        client = next(iter(accounts.values()))
+        main_window().executor.submit(
+            lambda: client.api.get_display_name(user_id) or user_id,
+            kind           = "display_name",
+            priority       = NORMAL,
+            callback       = lambda name: self._on_resolved(user_id, name),
+            error_callback = lambda _: self._on_resolved(user_id, user_id),
+        )
+        return user_id
+
+
+    def resolving(self, user_id: str) -> bool:
+        "Return whether a profile lookup for `user_id` is running."
+        with self._lock:
+            return user_id in self._resolving
+
+
+    def _on_resolved(self, user_id: str, name: str) -> None:
+        with self._lock:
+            self._senders[user_id] = name
+            self._resolving.discard(user_id)
+
+        self.signals.sender_resolved.emit(user_id, name)
+
+
+    def on_state_event(self, receiver_id: str, room_id: str, event: dict
+                      ) -> None:
+        etype   = event["type"]
+        content = event["content"]
+
+        with self._lock:
+            if etype == "m.room.member" and content.get("displayname"):
+                self._senders[event["state_key"]] = content["displayname"]
+
+            names = self._rooms.get((receiver_id, room_id))
+            if not names:
+                return
+
+            if etype == "m.room.name":
+                names.name = content.get("name") or ""
+
+            elif etype == "m.room.canonical_alias":
+                names.alias = content.get("alias") or ""
+
+            elif etype == "m.room.member" and \
+                 event["state_key"] != receiver_id:
+                user_id = event["state_key"]
+
+                if content.get("membership") in ("join", "invite"):
+                    names.set_member(user_id,
+                                     content.get("displayname") or user_id)
+                else:
+                    names.del_member(user_id)
+
+
+    def forget_room(self, user_id: str, room_id: str) -> None:
+        with self._lock:
+            self._rooms.pop((user_id, room_id), None)
+
+
+    def forget_account(self, user_id: str) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+            for key in [k for k in self._rooms if k[0] == user_id]:
+                del self._rooms[key]
+
+
+    def on_account_change(self, user_id: str, _: str, new_display_name: str,
+                          __: str) -> None:
+        with self._lock:
+            self._users[user_id] = new_display_name
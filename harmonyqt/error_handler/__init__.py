@@ -2,14 +2,12 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import atexit
-import os
 import sys
 import threading
 from traceback import format_exception, print_exc, print_exception
 from types import TracebackType
 from typing import List, Type
 
-from atomicfile import AtomicFile
 from PyQt5.QtCore import QDateTime, QObject, pyqtSignal
 
 from ..__about__ import __email__
@@ -23,11 +21,13 @@ PLEASE_REPORT = (
     f"<a href='{URL_ISSUES}' {A_STYLE}>GitHub</a> or "
     f"by email to <a href='mailto:{EMAIL}' {A_STYLE}>{EMAIL}</a>."
 )
-LOG_PATH   = get_error_file()
-WRITE_LOCK = threading.Lock()
+LOG_PATH = get_error_file()
 
 # pylint: disable=wrong-import-position
 from .console import Console
+from .sink import ErrorSink
+
+SINK = ErrorSink(LOG_PATH)
 
 CAUGTH_EXCEPTION_MAY_EXIT: List[str] = []
 
@@ -39,24 +39,29 @@ def except_hook(type_:     Type[BaseException],
     if type_ is KeyboardInterrupt:
         sys.exit(130)
 
-    try:
-        print_exception(type_, value, traceback)
-    except OSError:  # No terminal connected
-        pass
-
-    trace_str = "\n".join(format_exception(type_, value, traceback))
-    date      = QDateTime.currentDateTime().toString("yyyy-MM-dd HH:mm:ss.z t")
+    now         = QDateTime.currentDateTime()
+    trace_str   = "\n".join(format_exception(type_, value, traceback))
+    date        = now.toString("yyyy-MM-dd HH:mm:ss.z t")
+    count, show = SINK.add(trace_str, date)
 
-    add_to_log_file(trace_str, date)
+    if show:
+        try:
+            print_exception(type_, value, traceback)
+        except OSError:  # No terminal connected
+            pass
 
     try:
         from .. import main_window
         window = main_window()
 
         if window.isVisible() and hasattr(window, "error_dock"):
-            CAUGTH_EXCEPTION_MAY_EXIT.append(trace_str)
-            window.show_error_dock()
-            window.error_dock.widget().display.print_error(trace_str, date)
+            CAUGTH_EXCEPTION_MAY_EXIT[:] = [trace_str]
+
+            if show:
+                window.show_error_dock()
+                window.error_dock.widget().display.print_error(
+                    trace_str, date, count
+                )
             return
     except Exception:
         print_exc()
@@ -64,14 +69,8 @@ def except_hook(type_:     Type[BaseException],
     show_box(trace_str)
 
 
-def add_to_log_file(trace_str: str, date: str) -> None:
-    with WRITE_LOCK:
-        mode = "a" if os.path.exists(LOG_PATH) else "w"
-        with open(LOG_PATH, mode) as out_file:
-            out_file.write(f"{date}\n\n{trace_str}\n\n\n")
-
-
 def show_box(trace_str: str) -> None:
+    SINK.flush()
     from . import boxes
     boxes.FatalErrorBox(trace_str).exec_()
     sys.exit(99)
@@ -94,6 +93,10 @@ def error_box_if_console_exited():
         show_box(trace_str=err)
 
 
+# Registered last to run first, before an error box is shown
+atexit.register(SINK.flush)
+
+
 class ExceptHookFromThreadCaller(QObject):
     call = pyqtSignal(tuple)
 
@@ -1,10 +1,15 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv2.
 
-from PyQt5.QtGui import QTextTableFormat
+from collections import OrderedDict
+
+from PyQt5.QtGui import QTextCursor, QTextTable, QTextTableFormat
 
 from ..message_display import MessageDisplay
 
+# Oldest errors are removed from the console past that number
+MAX_CONSOLE_ENTRIES = 100
+
 
 class ConsoleDisplay(MessageDisplay):
     def __init__(self) -> None:
@@ -13,12 +18,37 @@ class ConsoleDisplay(MessageDisplay):
         self.error_format.setBorder(0)
         self.error_format.setTopMargin(self.font_height * 3)
 
+        self.errors: "OrderedDict[str, QTextTable]" = OrderedDict()
 
-    def print_error(self, trace_str: str, date: str) -> None:
+
+    def print_error(self, trace_str: str, date: str, count: int = 1
+                   ) -> None:
+        """Print an error, or update its date and count if the same
+        `trace_str` is already shown."""
         trace = trace_str.rstrip()
-        self.system_print(
-            f"<h3>{date}</h3><br><pre><code>{trace}</code></pre>",
-            level        = "error",
-            is_html      = True,
-            table_format = self.error_format,
-        )
+        times = f" ({count} times)" if count > 1 else ""
+        html  = f"<h3>{date}{times}</h3><br><pre><code>{trace}</code></pre>"
+        table = self.errors.pop(trace_str, None)
+
+        if table is not None:
+            self._replace_cell(table, 0,
+                               self._system_html(html, "error", True))
+        else:
+            table = self.system_print(html,
+                                      level        = "error",
+                                      is_html      = True,
+                                      table_format = self.error_format)
+
+        self.errors[trace_str] = table
+
+        while len(self.errors) > MAX_CONSOLE_ENTRIES:
+            self._remove_table(self.errors.popitem(last=False)[1])
+
+
+    def _remove_table(self, table: QTextTable) -> None:
+        cursor = QTextCursor(self.document())
+        cursor.beginEditBlock()
+        cursor.setPosition(table.firstPosition() - 1)
+        cursor.setPosition(table.lastPosition() + 1, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        cursor.endEditBlock()
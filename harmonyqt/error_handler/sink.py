@@ -0,0 +1,142 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from traceback import print_exc
+from typing import List, Optional, Tuple
+
+# Seconds between writes of the collected errors to the log file
+FLUSH_INTERVAL = 1
+
+# When the log file would grow bigger than that many bytes, it is renamed
+# to <file>.1, the previous <file>.1 to <file>.2, etc
+MAX_LOG_SIZE = 1024 * 1024
+MAX_LOG_BACKUPS = 3
+
+# Repeats of an already shown error are shown again at most once during
+# that many seconds
+SHOW_INTERVAL = 1
+
+# Max number of different errors whose repeats are counted
+MAX_TRACKED = 1000
+
+
+class _Seen:
+    __slots__ = ("count", "unwritten", "first_date", "last_date",
+                 "last_shown")
+
+    def __init__(self, date: str) -> None:
+        self.count:      int   = 0
+        self.unwritten:  int   = 0
+        self.first_date: str   = date
+        self.last_date:  str   = date
+        self.last_shown: float = 0
+
+
+class ErrorSink:
+    """Collect error traces and write them to a log file in a thread.
+
+    Identical traces are written once per batch with their number of
+    repeats. `add()` tells whether an error should be shown again, so that
+    an error repeating in a loop doesn't flood the terminal and console."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._seen:   "OrderedDict[str, _Seen]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        # Unwritten entries of errors no longer tracked
+        self._dropped: List[str] = []
+
+
+    def add(self, trace_str: str, date: str) -> Tuple[int, bool]:
+        """Queue an error to be written. Return how many times it happened
+        and if it should be shown."""
+        with self._lock:
+            seen = self._seen.pop(trace_str, None) or _Seen(date)
+            self._seen[trace_str] = seen  # Now the most recent
+
+            while len(self._seen) > MAX_TRACKED:
+                old_trace, old = self._seen.popitem(last=False)
+                if old.unwritten:
+                    self._dropped.append(self._entry(old_trace, old))
+
+            if not seen.unwritten:
+                seen.first_date = date
+
+            seen.count     += 1
+            seen.unwritten += 1
+            seen.last_date  = date
+
+            now  = time.monotonic()
+            show = seen.count == 1 or now - seen.last_shown >= SHOW_INTERVAL
+            if show:
+                seen.last_shown = now
+
+            if not self._thread:
+                self._thread = threading.Thread(target=self._write_loop,
+                                                daemon=True)
+                self._thread.start()
+
+        return (seen.count, show)
+
+
+    def _write_loop(self) -> None:
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                # Not raised, the except hook would send it back here
+                print_exc()
+
+
+    def flush(self) -> None:
+        "Write the errors added since the last flush now."
+        with self._lock:
+            entries       = self._dropped
+            self._dropped = []
+
+            for trace_str, seen in self._seen.items():
+                if seen.unwritten:
+                    entries.append(self._entry(trace_str, seen))
+
+        if entries:
+            self._write("".join(entries))
+
+
+    @staticmethod
+    def _entry(trace_str: str, seen: _Seen) -> str:
+        "Return the log entry for `seen`'s unwritten repeats, reset them."
+        date = seen.last_date
+        if seen.unwritten > 1:
+            date = (f"{seen.first_date} - {seen.last_date}, "
+                    f"{seen.unwritten} times")
+
+        seen.unwritten = 0
+        return f"{date}\n\n{trace_str}\n\n\n"
+
+
+    def _write(self, text: str) -> None:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+
+        if size and size + len(text) > MAX_LOG_SIZE:
+            self._rotate()
+
+        with open(self.path, "a") as out_file:
+            out_file.write(text)
+
+
+    def _rotate(self) -> None:
+        for i in range(MAX_LOG_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+
+        os.replace(self.path, f"{self.path}.1")
@@ -13,6 +13,7 @@ from dataclasses import dataclass, field
 from PyQt5.QtCore import QDateTime, QStandardPaths
 
 from . import main_window
+from .utils import PATHS
 
 
 @dataclass
@@ -29,10 +30,9 @@ class EventLogger:
 
 
     def __post_init__(self) -> None:
-        qsp = QStandardPaths
         self.base_dir = (
             Path(self.base_dir) if self.base_dir else
-            Path(qsp.writableLocation(qsp.AppDataLocation)) / "logs"
+            Path(PATHS.directory(QStandardPaths.AppDataLocation, "logs"))
         )
         self.json_dumps_kwargs = self.json_dumps_kwargs or {
             "indent":       4,
@@ -64,24 +64,25 @@ class EventLogger:
                       .toString(self.date_format)
         )
 
-        if not path.exists():
-            path.parent.mkdir(parents=True, exist_ok=True)
-            path.write_text("[]")
+        PATHS.ensure_dir(path.parent)
 
-        with open(path, "r") as in_file, AtomicFile(path, "w") as out_file:
-            logged: List[dict] = json.loads(in_file.read())
+        try:
+            with open(path, "r") as in_file:
+                logged: List[dict] = json.loads(in_file.read())
+        except FileNotFoundError:
+            logged = []
 
-            if self.allow_event_overwriting:
-                logged = [e for e in logged
-                          if e["event_id"] != event["event_id"]]
-            else:
-                for logged_ev in logged:
-                    if logged_ev["event_id"] == event["event_id"]:
-                        return
+        if self.allow_event_overwriting:
+            logged = [e for e in logged if e["event_id"] != event["event_id"]]
+        else:
+            for logged_ev in logged:
+                if logged_ev["event_id"] == event["event_id"]:
+                    return
 
-            logged.append(event)
-            logged.sort(key=lambda ev: ev["origin_server_ts"])
+        logged.append(event)
+        logged.sort(key=lambda ev: ev["origin_server_ts"])
 
+        with AtomicFile(path, "w") as out_file:
             out_file.write(json.dumps(logged, **self.json_dumps_kwargs))
 
 
@@ -2,7 +2,6 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import json
-import time
 from multiprocessing.pool import ThreadPool
 from threading import Lock
 from typing import Dict, Set
@@ -12,6 +11,9 @@ from PyQt5.QtCore import QDateTime, QObject, pyqtSignal
 from matrix_client.client import MatrixClient
 
 from . import main_window, message
+from .sync_watchdog import SyncWatchdog
+
+SYNC_TIMEOUT_MS = 10_000
 
 
 class _SignalObject(QObject):
@@ -26,6 +28,8 @@ class _SignalObject(QObject):
     account_gone = pyqtSignal(str)
     # User ID, room ID, new display name, new avatar URL
     account_change = pyqtSignal(str, str, str, str)
+    # User ID, one of sync_watchdog.STATES
+    connection_state = pyqtSignal(str, str)
 
     # User ID, room ID
     new_room    = pyqtSignal(str, str)
@@ -47,6 +51,8 @@ class EventManager:
         self._added_rooms:   Dict[str, Set[str]] = {}  # {user_id: {room_id}}
         self._got_event_ids: Dict[str, Set[str]] = {}  # {user_id: {event_id}}
 
+        self.sync_watchdogs: Dict[str, SyncWatchdog] = {}  # {user_id: dog}
+
         self._lock = Lock()
 
         main_window().accounts.signals.login.connect(self.add_account)
@@ -72,20 +78,26 @@ class EventManager:
         client.add_leave_listener(
             lambda rid, _: self.on_leave_event(user_id, rid))
 
-        client.start_listener_thread(
-            timeout_ms=10_000, exception_handler=self._on_sync_error
-        )
-
         self.signals.new_account.emit(client.user_id)
 
+        watchdog = SyncWatchdog(
+            client,
+            timeout_ms      = SYNC_TIMEOUT_MS,
+            on_error        = self._on_sync_error,
+            on_state_change = lambda state, u=user_id:
+                self.signals.connection_state.emit(u, state),
+        )
+        self.sync_watchdogs[user_id] = watchdog
+        watchdog.start()
+
 
     @staticmethod
     def _on_sync_error(err: BaseException) -> None:
+        # Retrying with a backoff delay is handled by the SyncWatchdog
         try:
             print(err)
         except OSError:
             pass
-        time.sleep(5)
 
 
     def add_room_listeners(self, user_id: str, room_id: str) -> None:
@@ -98,10 +110,18 @@ class EventManager:
             lambda _, ev: self.on_ephemeral_event(user_id, ev))
 
         room.add_state_listener(
-            lambda ev: self.on_state_event(user_id, ev))
+            lambda ev: self.on_state_event(user_id, room_id, ev))
+
+        # Events received before this listener existed would be missing from
+        # a cached entry, it will be rebuilt from the current state.
+        main_window().display_names.forget_room(user_id, room_id)
 
 
     def on_account_logout(self, receiver_id: str) -> None:
+        watchdog = self.sync_watchdogs.pop(receiver_id, None)
+        if watchdog:
+            watchdog.stop()
+
         self.signals.account_gone.emit(receiver_id)
 
 
@@ -177,6 +197,8 @@ class EventManager:
             markdown       = ev["content"]["body"],
             html           = ev["content"].get("formatted_body", ""),
             ms_since_epoch = ev["origin_server_ts"],
+            event_id       = ev["event_id"],
+            txn_id         = ev.get("unsigned", {}).get("transaction_id", ""),
         )
         self.signals.new_message.emit(msg)
 
@@ -191,10 +213,21 @@ class EventManager:
 
 
     def on_ephemeral_event(self, receiver_id: str, event: dict) -> None:
+        if event.get("type") == "m.receipt":
+            main_window().unread.on_receipt(receiver_id, event)
+            return
+
         self._log("purple", "unhandled ephemeral event", receiver_id, event)
 
 
-    def on_state_event(self, receiver_id: str, event: dict) -> None:
+    def on_state_event(self, receiver_id: str, room_id: str, event: dict
+                      ) -> None:
+        if event.get("type") in ("m.room.name", "m.room.canonical_alias",
+                                 "m.room.member"):
+            main_window().display_names.on_state_event(receiver_id, room_id,
+                                                       event)
+            return
+
         self._log("cyan", "unhandled state event", receiver_id, event)
 
 
@@ -0,0 +1,320 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import heapq
+import itertools
+import threading
+from typing import (
+    Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+)
+
+# Task priorities, lower runs first
+HIGH   = 0   # e.g. something the user is looking at or waiting for
+NORMAL = 10
+LOW    = 20  # e.g. rows not scrolled into view yet
+
+WORKERS = 8
+
+# Max number of tasks of a kind running at the same time,
+# kinds not listed here can use all workers.
+KIND_LIMITS: Dict[str, int] = {
+    "display_name": 3,
+    "device_info":  6,
+    "decrypt":      4,
+    # Must be lower than WORKERS, see below
+    "command":      4,
+}
+
+# Commands can wait for other tasks, e.g. /devices for device_info lookups,
+# and a command that timed out keeps its worker until it returns.
+# Stuck commands must always leave workers for the other tasks.
+assert KIND_LIMITS["command"] < WORKERS, "Commands could take all workers"
+
+Callback      = Optional[Callable[[Any], None]]
+ErrorCallback = Optional[Callable[[BaseException], None]]
+
+
+class TaskCancelledError(Exception):
+    "Raised by `Task.get()` for tasks cancelled before they started."
+
+
+class Task:
+    "Handle for a function submitted to an `Executor`."
+
+    def __init__(self,
+                 executor:       "Executor",
+                 func:           Callable[..., Any],
+                 args:           Sequence[Any],
+                 kwargs:         Dict[str, Any],
+                 kind:           str,
+                 priority:       int,
+                 callback:       Callback,
+                 error_callback: ErrorCallback) -> None:
+        self.executor       = executor
+        self.func           = func
+        self.args           = args
+        self.kwargs         = kwargs
+        self.kind           = kind
+        self.priority       = priority
+        self.callback       = callback
+        self.error_callback = error_callback
+
+        self.started:   bool = False
+        self.cancelled: bool = False
+
+        self.result: Any                     = None
+        self.error:  Optional[BaseException] = None
+        self._done:  threading.Event         = threading.Event()
+
+
+    @property
+    def pending(self) -> bool:
+        return not self.started and not self.cancelled
+
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+
+    def cancel(self) -> bool:
+        """Prevent the task from running if it didn't start yet.
+        Return whether the task was cancelled."""
+        with self.executor.lock:
+            if self.started:
+                return False
+
+            self.cancelled = True
+
+        self._done.set()
+        return True
+
+
+    def set_priority(self, priority: int) -> None:
+        self.executor.set_priority(self, priority)
+
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        "Wait for the task to finish, return its result or raise its error."
+        if not self._done.wait(timeout):
+            raise TimeoutError()
+
+        if self.cancelled:
+            raise TaskCancelledError()
+
+        if self.error:
+            raise self.error
+
+        return self.result
+
+
+    def _run(self) -> None:
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except Exception as err:  # pylint: disable=broad-except
+            self.error = err
+        finally:
+            self._done.set()
+
+        if self.error and self.error_callback:
+            self.error_callback(self.error)
+        elif not self.error and self.callback:
+            self.callback(self.result)
+
+
+class Executor:
+    """Application-wide pool of worker threads running tasks by priority.
+
+    The number of threads never exceeds `workers`, whatever the number of
+    submitted tasks. Tasks with a lower priority number run first, in
+    submission order for equal priorities.
+    `kind_limits` caps the number of running tasks of a given kind,
+    so that e.g. hundreds of room name lookups can't delay a device query.
+
+    Like with `multiprocessing.pool.ThreadPool`, callbacks are called from
+    the worker threads. An error raised by a callback ends its worker, to be
+    reported by `sys.excepthook`, and another worker is started instead.
+
+    A task must not wait for other tasks, e.g. with `map()`, or all workers
+    could end up waiting. The exception is tasks of a kind whose limit is
+    lower than `workers`, like `"command"` (/devices maps device_info
+    lookups): they can never take every worker, the waited tasks always
+    get one."""
+
+    def __init__(self,
+                 workers:     int                      = WORKERS,
+                 kind_limits: Optional[Dict[str, int]] = None) -> None:
+        self.workers     = workers
+        self.kind_limits = KIND_LIMITS if kind_limits is None else kind_limits
+
+        self.lock     = threading.Lock()
+        self._wakeup  = threading.Condition(self.lock)
+        self._counter = itertools.count()
+
+        # [(priority, submission number, task)], entries with a priority
+        # different from their task's current priority are stale.
+        self._queue:   List[Tuple[int, int, Task]] = []
+        self._running: Dict[str, int]              = {}
+        self._threads: List[threading.Thread]      = []
+        self._idle:    int                         = 0
+
+
+    def submit(self,
+               func:           Callable[..., Any],
+               *args:          Any,
+               kind:           str           = "",
+               priority:       int           = NORMAL,
+               callback:       Callback      = None,
+               error_callback: ErrorCallback = None,
+               **kwargs:       Any) -> Task:
+
+        task = Task(self, func, args, kwargs, kind, priority,
+                    callback, error_callback)
+
+        with self.lock:
+            heapq.heappush(self._queue,
+                           (priority, next(self._counter), task))
+
+            # Idle workers may already have been notified for other tasks
+            if len(self._queue) > self._idle:
+                self._start_worker()
+
+            self._wakeup.notify()
+
+        return task
+
+
+    def _start_worker(self) -> None:
+        "Must be called with the lock held."
+        if len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+
+    def map(self,
+            func:     Callable[[Any], Any],
+            iterable: Iterable[Any],
+            kind:     str = "",
+            priority: int = NORMAL) -> List[Any]:
+        "Run `func` for each item in parallel, wait and return the results."
+        tasks = [self.submit(func, item, kind=kind, priority=priority)
+                 for item in iterable]
+        return [task.get() for task in tasks]
+
+
+    def map_async(self,
+                  func:           Callable[[Any], Any],
+                  iterable:       Iterable[Any],
+                  kind:           str           = "",
+                  priority:       int           = NORMAL,
+                  callback:       Callback      = None,
+                  error_callback: ErrorCallback = None) -> List[Task]:
+        """Like `map()` without waiting. `callback` receives the results once
+        all tasks succeeded, `error_callback` the first error."""
+        items   = list(iterable)
+        results = [None] * len(items)
+        left    = [len(items)]
+        failed  = [False]
+        lock    = threading.Lock()
+
+        def on_done(i: int, result: Any) -> None:
+            with lock:
+                results[i]  = result
+                left[0]    -= 1
+                all_done    = left[0] == 0 and not failed[0]
+
+            if all_done and callback:
+                callback(results)
+
+        def on_error(err: BaseException) -> None:
+            with lock:
+                first     = not failed[0]
+                failed[0] = True
+
+            if first and error_callback:
+                error_callback(err)
+
+        if not items and callback:
+            callback(results)
+
+        return [
+            self.submit(func, item, kind=kind, priority=priority,
+                        callback=lambda r, i=i: on_done(i, r),
+                        error_callback=on_error)
+            for i, item in enumerate(items)
+        ]
+
+
+    def set_priority(self, task: Task, priority: int) -> None:
+        with self.lock:
+            if not task.pending or task.priority == priority:
+                return
+
+            task.priority = priority
+            heapq.heappush(self._queue,
+                           (priority, next(self._counter), task))
+            self._wakeup.notify()
+
+
+    def _next_task(self) -> Optional[Task]:
+        "Pop the first runnable task, must be called with the lock held."
+        skipped: List[Tuple[int, int, Task]] = []
+        found:   Optional[Task]              = None
+
+        while self._queue:
+            entry             = heapq.heappop(self._queue)
+            priority, _, task = entry
+
+            if not task.pending or priority != task.priority:
+                continue  # cancelled, or stale entry after set_priority()
+
+            limit = self.kind_limits.get(task.kind)
+            if limit is not None and self._running.get(task.kind, 0) >= limit:
+                skipped.append(entry)
+                continue
+
+            found = task
+            break
+
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+        return found
+
+
+    def _work(self) -> None:
+        try:
+            self._work_loop()
+        except BaseException:
+            # Raised by a callback, the error is reported when this thread
+            # ends. Don't leave queued tasks without the worker.
+            with self.lock:
+                self._threads.remove(threading.current_thread())
+
+                if self._queue:
+                    self._start_worker()
+            raise
+
+
+    def _work_loop(self) -> None:
+        while True:
+            with self.lock:
+                task = self._next_task()
+
+                while not task:
+                    self._idle += 1
+                    self._wakeup.wait()
+                    self._idle -= 1
+                    task = self._next_task()
+
+                task.started             = True
+                self._running[task.kind] = self._running.get(task.kind, 0) + 1
+
+            try:
+                task._run()  # pylint: disable=protected-access
+            finally:
+                with self.lock:
+                    self._running[task.kind] -= 1
+                    # A task of this kind may be waiting for a free slot
+                    self._wakeup.notify_all()
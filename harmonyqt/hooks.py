@@ -0,0 +1,128 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+"""Ordered, optionally concurrent execution of initialization hooks.
+
+Hook dicts like `main.HOOKS_INIT_*` or `chat.CHAT_INIT_HOOKS` map a name to
+a `Hook`, or to a plain function which is treated as a GUI hook without
+dependencies.
+
+GUI hooks run in the calling thread, other hooks run on the application's
+`Executor` as soon as the hooks they depend on are done, in parallel with
+each other and with GUI hooks."""
+
+import time
+from queue import Queue
+from typing import Any, Callable, Dict, Optional, Sequence, Set, Tuple, Union
+
+from dataclasses import dataclass
+
+from . import main_window, startup_profile
+from .executor import HIGH
+
+# {hook name: seconds taken}
+HookTimings = Dict[str, float]
+
+
+class HookError(Exception):
+    "Raised for hooks with unknown or circular dependencies."
+
+
+@dataclass
+class Hook:
+    func: Callable[..., None]
+    # Names of the hooks, in the same dict, that must be done before this one
+    after: Sequence[str] = ()
+    # False if the hook doesn't create or touch widgets, and is safe to run
+    # in another thread.
+    gui: bool = True
+
+
+HookDict = Dict[str, Union[Hook, Callable[..., None]]]
+
+
+def _check(hooks: Dict[str, Hook]) -> None:
+    for name, hook in hooks.items():
+        for dep in hook.after:
+            if dep not in hooks:
+                raise HookError(f"Hook {name!r} depends on unknown {dep!r}.")
+
+    # Remove hooks without unresolved dependencies until none are left
+    left = dict(hooks)
+
+    while left:
+        free = [n for n, h in left.items() if not set(h.after) & set(left)]
+        if not free:
+            raise HookError(f"Circular dependencies between {sorted(left)}.")
+
+        for name in free:
+            del left[name]
+
+
+def run_hooks(hooks: HookDict, *args: Any, kind: str = "Hook"
+             ) -> HookTimings:
+    """Call every hook with `args` and wait for them to be done.
+    Return the time taken by each hook. If a hook raises an exception,
+    it is raised here once the hooks already running are done."""
+
+    todo: Dict[str, Hook] = {
+        name: hook if isinstance(hook, Hook) else Hook(hook)
+        for name, hook in hooks.items()
+    }
+    _check(todo)
+
+    timings: HookTimings = {}
+    done:    Set[str]    = set()
+    workers: Set[str]    = set()
+    # Number of started hooks that didn't put their result in `finished` yet
+    outstanding: int = 0
+    # (hook name, start, duration, exception raised)
+    finished: "Queue[Tuple[str, float, float, Optional[Exception]]]" = \
+        Queue()
+
+    def timed(name: str, hook: Hook) -> None:
+        start = time.perf_counter()
+        error = None
+        try:
+            hook.func(*args)
+        except Exception as err:  # pylint: disable=broad-except
+            error = err
+        finished.put((name, start, time.perf_counter() - start, error))
+
+    first_error: Optional[Exception] = None
+
+    while True:
+        if not first_error:
+            for name in [n for n, h in todo.items()
+                         if not h.gui and set(h.after) <= done]:
+                main_window().executor.submit(timed, name, todo.pop(name),
+                                              priority=HIGH)
+                workers.add(name)
+                outstanding += 1
+
+            # Non-GUI hooks that were ready have been submitted above
+            gui_ready = next(
+                (n for n, h in todo.items() if set(h.after) <= done), None
+            )
+            if gui_ready:
+                with startup_profile.phase(f"{kind}: {gui_ready}"):
+                    timed(gui_ready, todo.pop(gui_ready))
+                outstanding += 1
+
+        if not outstanding:
+            break
+
+        name, start, duration, error = finished.get()
+        outstanding   -= 1
+        timings[name]  = duration
+        first_error    = first_error or error
+        done.add(name)
+
+        if name in workers:
+            startup_profile.record(f"{kind}: {name} (worker thread)",
+                                   start, duration)
+
+    if first_error:
+        raise first_error
+
+    return timings
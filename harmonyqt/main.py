@@ -9,17 +9,19 @@ from PyQt5.QtWidgets import (
     QApplication, QDesktopWidget, QMainWindow, QTabWidget, QWidget
 )
 
-HooksType = Dict[str, Callable[["MainWindow"], None]]
+# pylint: disable=wrong-import-position
+from .hooks import HookDict, HookTimings, run_hooks
 
-HOOKS_INIT_1_START:        HooksType = {}
-HOOKS_INIT_2_BEFORE_LOGIN: HooksType = {}
-HOOKS_INIT_3_END:          HooksType = {}
+# Values are harmonyqt.hooks.Hook objects, or functions taking the MainWindow
+HOOKS_INIT_1_START:        HookDict = {}
+HOOKS_INIT_2_BEFORE_LOGIN: HookDict = {}
+HOOKS_INIT_3_END:          HookDict = {}
 
-# pylint: disable=wrong-import-position
 from . import (
-    __about__, app, error_handler, homepage, theming, toolbar, usertree
+    __about__, app, error_handler, homepage, startup_profile, theming,
+    toolbar, usertree
 )
-from .chat import ChatDock
+from .chat import ChatDock, ChatPool
 from .dock import Dock
 
 
@@ -71,6 +73,9 @@ class MainWindow(QMainWindow):
         self.title_bars_shown: bool = False
         self.normal_close:     bool = False
 
+        # {hook name: seconds taken} for the HOOKS_INIT_* hooks
+        self.init_hook_timings: HookTimings = {}
+
 
     def construct(self) -> None:
         # pylint: disable=attribute-defined-outside-init
@@ -79,13 +84,21 @@ class MainWindow(QMainWindow):
 
         # Avoid import matrix_client stuff before we can init a QApplication
         from .accounts import AccountManager
+        from .decryption import Decryptor
+        from .device_info import DeviceInfoService
+        from .display_names import DisplayNames
         from .event_logger import EventLogger
         from .events import EventManager
+        from .executor import Executor
+        from .outbox import Outbox
         from .shortcuts import Shortcut, ShortcutManager
+        from .unread import UnreadCounter
 
 
-        for func in HOOKS_INIT_1_START.values():
-            func(self)
+        # Needed by hooks that don't run in the GUI thread
+        self.executor: Executor = Executor()
+
+        self._run_hooks(HOOKS_INIT_1_START, "Start hook")
 
         # Setup error console:
 
@@ -110,10 +123,17 @@ class MainWindow(QMainWindow):
 
         # Setup main classes and event listeners:
 
-        self.event_logger: EventLogger     = EventLogger()
-        self.accounts:     AccountManager  = AccountManager()
-        self.events:       EventManager    = EventManager()
-        self.shortcuts:    ShortcutManager = ShortcutManager()
+        with startup_profile.phase("Setup main classes"):
+            self.event_logger:  EventLogger       = EventLogger()
+            self.accounts:      AccountManager    = AccountManager()
+            self.events:        EventManager      = EventManager()
+            self.decryption:    Decryptor         = Decryptor()
+            self.display_names: DisplayNames      = DisplayNames()
+            self.device_info:   DeviceInfoService = DeviceInfoService()
+            self.unread:        UnreadCounter     = UnreadCounter()
+            self.shortcuts:     ShortcutManager   = ShortcutManager()
+            self.outbox:        Outbox            = Outbox()
+            self.chats:         ChatPool          = ChatPool()
 
         self.event_logger.start()
 
@@ -128,17 +148,19 @@ class MainWindow(QMainWindow):
         self.setDockNestingEnabled(True)
         self.setTabPosition(Qt.AllDockWidgetAreas, QTabWidget.North)
 
-        self.tree_dock = Dock("Accounts / Rooms", self)
-        self.tree_dock.setWidget(usertree.UserTree())
-        self.addDockWidget(Qt.LeftDockWidgetArea, self.tree_dock)
+        with startup_profile.phase("Setup main UI parts"):
+            self.tree_dock = Dock("Accounts / Rooms", self)
+            self.tree_dock.setWidget(usertree.UserTree())
+            self.addDockWidget(Qt.LeftDockWidgetArea, self.tree_dock)
 
-        self.actions_dock = Dock("Actions", self)
-        self.actions_dock.setWidget(toolbar.ActionsBar())
-        self.splitDockWidget(self.tree_dock, self.actions_dock, Qt.Vertical)
+            self.actions_dock = Dock("Actions", self)
+            self.actions_dock.setWidget(toolbar.ActionsBar())
+            self.splitDockWidget(self.tree_dock, self.actions_dock,
+                                 Qt.Vertical)
 
-        self.home_dock = Dock("Home", self)
-        self.home_dock.setWidget(homepage.HomePage())
-        self.addDockWidget(Qt.RightDockWidgetArea, self.home_dock)
+            self.home_dock = Dock("Home", self)
+            self.home_dock.setWidget(homepage.HomePage())
+            self.addDockWidget(Qt.RightDockWidgetArea, self.home_dock)
 
         # {(user_id, room_id): dock}
         self.visible_chat_docks: Dict[Tuple[str, str], ChatDock] = {}
@@ -162,16 +184,19 @@ class MainWindow(QMainWindow):
 
         self.show()
 
-        for func in HOOKS_INIT_2_BEFORE_LOGIN.values():
-            func(self)
+        self._run_hooks(HOOKS_INIT_2_BEFORE_LOGIN, "Before login hook")
 
         try:
-            self.accounts.login_using_config()
+            with startup_profile.phase("Start logging in accounts"):
+                self.accounts.login_using_config()
         except FileNotFoundError:
             pass
 
-        for func in HOOKS_INIT_3_END.values():
-            func(self)
+        self._run_hooks(HOOKS_INIT_3_END, "End hook")
+
+
+    def _run_hooks(self, hooks: HookDict, kind: str) -> None:
+        self.init_hook_timings.update(run_hooks(hooks, self, kind=kind))
 
 
     def show_dock_title_bars(self, show: Optional[bool] = None) -> None:
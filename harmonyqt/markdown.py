@@ -2,9 +2,10 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import re
+from typing import Any
 
-import markdown2
-from markdownify import markdownify
+# markdown2 and markdownify are imported when first used, they are slow to
+# import and not needed until a message is sent or received.
 
 CONVERT_TO_MD_EXTRAS = [
     # Insert line break on \n instead of required two spaces at line end:
@@ -52,15 +53,22 @@ CONVERT_TO_MD_DISABLED_EXTRAS = [
     "toc",
 ]
 
-_TO_MARKDOWN = markdown2.Markdown(extras    = CONVERT_TO_MD_EXTRAS,
-                                  safe_mode = "escape")
+_TO_MARKDOWN: Any = None  # markdown2.Markdown
 
 
 def from_html(html: str) -> str:
+    from markdownify import markdownify
     return markdownify(html)
 
 
 def to_html(markdown: str) -> str:
+    global _TO_MARKDOWN  # pylint: disable=global-statement
+
+    if not _TO_MARKDOWN:
+        import markdown2
+        _TO_MARKDOWN = markdown2.Markdown(extras    = CONVERT_TO_MD_EXTRAS,
+                                          safe_mode = "escape")
+
     html = _TO_MARKDOWN.convert(markdown)
 
     # Apply a class to \> escaped quotes
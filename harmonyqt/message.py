@@ -48,7 +48,21 @@ class Message:
             If not specified, the current time will be used.
 
         avatar_url:
-            HTTP(s) URL of the sender's avatar, if he has one."""
+            HTTP(s) URL of the sender's avatar, if he has one.
+
+        event_id:
+            ID of the event for messages received from the server.
+
+        txn_id:
+            Client transaction ID used to send this message, set when it is
+            queued by Message.send(). For messages received from the server,
+            only known if they were sent by the receiver's device.
+
+        state:
+            For locally echoed messages, `"pending"` while the message
+            waits in the outbox, `"failed"` if the server refused it.
+            `"undecrypted"` for decryption errors shown in place of a
+            message. Empty otherwise."""
 
     # Can't define a pyqtSignal(this_class) here
     local_echo_hooks: ClassVar[Dict[Any, Callable[["Message"], None]]] = {}
@@ -63,6 +77,10 @@ class Message:
     # If empty, use the default avatar icon
     avatar_url: Optional[str] = None
 
+    event_id: str = ""
+    txn_id:   str = ""
+    state:    str = ""
+
 
     def __post_init__(self) -> None:
         assert bool(self.sender_id), "No sender_id argument passed."
@@ -116,7 +134,8 @@ class Message:
     def html_content(self) -> str:
         "HTML to be displayed by a widget for the message's content."
 
-        return f"<div class='content {self._html_class}'>{self.html}</div>"
+        classes = " ".join(c for c in (self._html_class, self.state) if c)
+        return f"<div class='content {classes}'>{self.html}</div>"
 
 
     def was_created_before(self, ms_since_epoch: int) -> bool:
@@ -128,23 +147,12 @@ class Message:
 
     @property
     def sender_display_name(self) -> str:
-        "Display name for `self.sender_id`. Tries to avoid network requests."
+        """Display name for `self.sender_id`, or the ID itself if unknown
+        yet. Never makes network requests, see
+        `harmonyqt.display_names.DisplayNames.sender_name()`."""
 
-        try:
-            room = main_window().accounts[self.sender_id].rooms[self.room_id]
-        except KeyError:
-            pass
-        else:
-            name = room.members_displaynames.get(self.sender_id)
-            if name:
-                return name
-
-        for client in main_window().accounts.values():
-            user = client.users.get(self.sender_id)
-            if user:
-                return user.get_display_name()
-
-        return self.sender_id
+        return main_window().display_names.sender_name(self.sender_id,
+                                                       self.room_id)
 
 
     def linkify_in_html(self) -> None:
@@ -203,9 +211,14 @@ class Message:
 
 
     def send(self) -> None:
-        "Send this message to the room specified by `self.room_id`."
+        """Queue this message in the outbox to be sent to the room specified
+        by `self.room_id`, as soon as possible and in order."""
+
+        from .outbox import new_txn_id
+        self.txn_id = self.txn_id or new_txn_id()
+        self.state  = "pending"
 
-        room = main_window().accounts[self.sender_id].rooms[self.room_id]
         for func in self.local_echo_hooks.values():
             func(copy(self))
-        room.send_html(html=self.html, body=self.markdown)
+
+        main_window().outbox.enqueue(self)
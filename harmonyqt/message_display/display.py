@@ -2,11 +2,11 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import traceback
-from typing import Optional
+from typing import Dict, Optional
 
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import (
-    QFontMetrics, QResizeEvent, QTextCursor, QTextTableFormat
+    QFontMetrics, QResizeEvent, QTextCursor, QTextTable, QTextTableFormat
 )
 from PyQt5.QtWidgets import QTextBrowser
 
@@ -16,6 +16,8 @@ from harmonyqt.scroller import Scroller
 class MessageDisplay(QTextBrowser):
     # Useful for anything in a thread that wants to show text
     system_print_request = pyqtSignal(str, str, bool)  # text, level, is_html
+    # block ID, text, level, is_html, last update
+    system_block_request = pyqtSignal(str, str, str, bool, bool)
 
 
     def __init__(self) -> None:
@@ -42,7 +44,11 @@ class MessageDisplay(QTextBrowser):
         self.system_print_format.setBorder(0)
         self.system_print_format.setTopMargin(self.font_height)
 
+        # {block ID: table} for system_block()
+        self._system_blocks: Dict[str, QTextTable] = {}
+
         self.system_print_request.connect(self.system_print)
+        self.system_block_request.connect(self.system_block)
 
 
     def apply_style(self) -> None:
@@ -74,10 +80,54 @@ class MessageDisplay(QTextBrowser):
                      text:         str,
                      level:        str  = "info",
                      is_html:      bool = False,
-                     table_format: Optional[QTextTableFormat] = None) -> None:
-        assert level in ("debug", "info", "warning", "error", "critical")
+                     table_format: Optional[QTextTableFormat] = None
+                    ) -> QTextTable:
         distance_from_bottom = self.scroller.vmax - self.scroller.v
 
+        cursor = QTextCursor(self.document())
+        cursor.beginEditBlock()
+        cursor.movePosition(QTextCursor.End)
+        table = cursor.insertTable(1, 1,
+                                   table_format or self.system_print_format)
+        cursor.insertHtml(self._system_html(text, level, is_html))
+        cursor.endEditBlock()
+
+        if distance_from_bottom <= 10:
+            self.scroller.go_min_left().go_bottom()
+
+        return table
+
+
+    def system_block(self,
+                     block_id: str,
+                     text:     str,
+                     level:    str  = "info",
+                     is_html:  bool = False,
+                     last:     bool = False) -> None:
+        """Print text like `system_print()` the first time `block_id` is
+        used, then replace the content of that same block.
+        Pass `last=True` for the last update of a block."""
+        table = self._system_blocks.get(block_id)
+
+        if table is None:
+            table = self.system_print(text, level, is_html)
+        else:
+            distance_from_bottom = self.scroller.vmax - self.scroller.v
+            self._replace_cell(table, 0,
+                               self._system_html(text, level, is_html))
+
+            if distance_from_bottom <= 10:
+                self.scroller.go_min_left().go_bottom()
+
+        if last:
+            self._system_blocks.pop(block_id, None)
+        else:
+            self._system_blocks[block_id] = table
+
+
+    @staticmethod
+    def _system_html(text: str, level: str, is_html: bool) -> str:
+        assert level in ("debug", "info", "warning", "error", "critical")
         html = text
 
         if not is_html:
@@ -87,14 +137,16 @@ class MessageDisplay(QTextBrowser):
             except Exception:
                 traceback.print_exc()
 
-        html = f"<div class='system {level}'>{html}</div>"
+        return f"<div class='system {level}'>{html}</div>"
+
+
+    @staticmethod
+    def _replace_cell(table: QTextTable, row: int, html: str) -> None:
+        cell   = table.cellAt(row, 0)
+        cursor = cell.firstCursorPosition()
 
-        cursor = QTextCursor(self.document())
         cursor.beginEditBlock()
-        cursor.movePosition(QTextCursor.End)
-        cursor.insertTable(1, 1, table_format or self.system_print_format)
+        cursor.setPosition(cell.lastCursorPosition().position(),
+                           QTextCursor.KeepAnchor)
         cursor.insertHtml(html)
         cursor.endEditBlock()
-
-        if distance_from_bottom <= 10:
-            self.scroller.go_min_left().go_bottom()
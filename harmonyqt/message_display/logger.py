@@ -45,6 +45,15 @@ class DisplayLogger:
         self.display.system_print_request.emit(msg % args, "critical", is_html)
 
 
+    def block(self, block_id: str, msg: str, level: str = "info",
+              is_html: bool = False, last: bool = False) -> None:
+        "Print `msg`, or replace the last message printed with `block_id`."
+        if self.level > getattr(logging, level.upper()):
+            return
+        self.display.system_block_request.emit(block_id, msg, level, is_html,
+                                               last)
+
+
     def exception(self, err: Exception, bad_func: Optional[Callable] = None
                  ) -> None:
         traceback.print_exc()
@@ -0,0 +1,330 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import atexit
+import json
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from atomicfile import AtomicFile
+from dataclasses import dataclass, field
+from PyQt5.QtCore import QDateTime, QObject, QStandardPaths, pyqtSignal
+
+from matrix_client.client import MatrixClient
+from matrix_client.errors import MatrixHttpLibError, MatrixRequestError
+
+from . import main_window
+from .message import Message
+from .utils import get_standard_path
+
+MAX_RETRY_DELAY = 60
+
+# Seconds after a change before the outbox is saved, changes made in the
+# meantime are saved together
+SAVE_DELAY = 0.5
+
+# Window in seconds used to compute SendPipelineStats.throughput
+THROUGHPUT_WINDOW = 60
+
+
+class _SignalObject(QObject):
+    # User ID, room ID, transaction ID, new state ("sent" or "failed"),
+    # event ID if sent
+    message_state = pyqtSignal(str, str, str, str, str)
+    # User ID, room ID, transaction ID, error message
+    send_error = pyqtSignal(str, str, str, str)
+
+
+def new_txn_id() -> str:
+    return f"harmonyqt.{uuid4().hex}"
+
+
+def is_transient_error(err: Exception) -> bool:
+    "Return whether sending again later could succeed after `err`."
+    if isinstance(err, MatrixHttpLibError):
+        return True
+
+    if isinstance(err, MatrixRequestError):
+        return err.code >= 500 or err.code == 429
+
+    return False
+
+
+@dataclass
+class SendPipelineStats:
+    sent:    int = 0
+    failed:  int = 0
+    retries: int = 0
+
+    # Seconds between messages creation and their acceptance by the server
+    total_latency: float = 0
+    last_latency:  float = 0
+
+    # time.monotonic() of the last sent messages
+    recent: Deque[float] = field(default_factory=Deque, repr=False)
+
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.sent if self.sent else 0
+
+
+    @property
+    def throughput(self) -> float:
+        "Messages sent per minute in the last `THROUGHPUT_WINDOW` seconds."
+        while self.recent and \
+              self.recent[0] < time.monotonic() - THROUGHPUT_WINDOW:
+            self.recent.popleft()
+
+        return len(self.recent) * 60 / THROUGHPUT_WINDOW
+
+
+    def add_sent(self, ms_since_epoch: int) -> None:
+        now_ms = QDateTime.currentDateTime().toMSecsSinceEpoch()
+
+        self.sent          += 1
+        self.last_latency   = max(0, now_ms - ms_since_epoch) / 1000
+        self.total_latency += self.last_latency
+        self.recent.append(time.monotonic())
+
+
+class SendPipeline:
+    """Ordered send queue for the messages of one account in one room.
+
+    A worker thread is started when messages are queued and exits once the
+    queue is empty. Pipelines of different rooms and accounts don't wait on
+    each other.
+
+    A message refused by the server is marked as failed and removed from
+    the queue. The following messages are still sent, the queue doesn't
+    stop at the failed one."""
+
+    def __init__(self, outbox: "Outbox", user_id: str, room_id: str,
+                 queue: Optional[Deque[dict]] = None) -> None:
+        self.outbox  = outbox
+        self.user_id = user_id
+        self.room_id = room_id
+        # [{txn_id, markdown, html, ms_since_epoch}]
+        self.queue: Deque[dict]       = queue or Deque()
+        self.stats: SendPipelineStats = SendPipelineStats()
+
+        self._wakeup: threading.Event            = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread)
+
+
+    def wake_up(self, retry_now: bool = False) -> None:
+        """Start the worker if needed. If `retry_now` and the worker is
+        waiting after a transient error, make it retry without waiting."""
+        with self.outbox.lock:
+            if not self._thread and self.queue:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+        if retry_now:
+            self._wakeup.set()
+
+
+    def _run(self) -> None:
+        retry_delay = 0.0
+
+        while True:
+            client = main_window().accounts.get(self.user_id)
+
+            with self.outbox.lock:
+                # Not logged in (anymore): Outbox.on_login will wake us up
+                if not self.queue or not client:
+                    self._thread = None
+                    return
+
+                msg = self.queue[0]
+
+            # Only wake-ups during the next backoff must cut it short
+            self._wakeup.clear()
+
+            try:
+                event_id = send_with_txn_id(client, self.room_id, msg)\
+                           .get("event_id", "")
+            except Exception as err:  # pylint: disable=broad-except
+                if is_transient_error(err):
+                    self.stats.retries += 1
+                    retry_delay = min(max(retry_delay * 2, 1), MAX_RETRY_DELAY)
+                    self._wakeup.wait(retry_delay)
+                    continue
+
+                self.stats.failed += 1
+                self._pop(msg, "failed", str(err))
+            else:
+                self.stats.add_sent(msg["ms_since_epoch"])
+                self._pop(msg, "sent", event_id=event_id)
+
+            retry_delay = 0
+
+
+    def _pop(self, msg: dict, state: str, error: str = "", event_id: str = ""
+            ) -> None:
+        with self.outbox.lock:
+            self.queue.remove(msg)
+            self.outbox.save_later()
+
+        sig = self.outbox.signals
+        if error:
+            sig.send_error.emit(self.user_id, self.room_id, msg["txn_id"],
+                                error)
+        sig.message_state.emit(self.user_id, self.room_id, msg["txn_id"],
+                               state, event_id)
+
+
+class Outbox:
+    """Durable queue of messages waiting to be sent.
+
+    Messages are saved to disk shortly after being queued and until the
+    server accepts them, and survive restarts.
+    Each account and room has its own `SendPipeline`, which sends messages in
+    order using their transaction ID to avoid duplicates on retries.
+    Transient errors like network issues are retried with an exponential
+    backoff, or as soon as the account's sync connection comes back."""
+
+    def __init__(self, path: str = "") -> None:
+        self.path = path or get_standard_path(
+            QStandardPaths.AppDataLocation, "outbox.json", "{}"
+        )
+        self.signals = _SignalObject()
+        self.lock    = threading.RLock()
+
+        # {(user_id, room_id): pipeline}
+        self.pipelines: Dict[Tuple[str, str], SendPipeline] = {}
+        self._load()
+
+        # Taken before self.lock, so that snapshots are written in order
+        self._save_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        atexit.register(self.save)
+
+        main_window().accounts.signals.login.connect(self.on_login)
+        main_window().events.signals.connection_state.connect(
+            self.on_connection_state
+        )
+
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r") as file:
+                saved = json.loads(file.read().strip() or "{}")
+        except (OSError, ValueError):
+            return
+
+        for user_id, rooms in saved.items():
+            for room_id, msgs in rooms.items():
+                self.pipelines[user_id, room_id] = \
+                    SendPipeline(self, user_id, room_id, Deque(msgs))
+
+
+    def save_later(self) -> None:
+        "Save in `SAVE_DELAY` seconds, unless a save is already planned."
+        with self.lock:
+            if self._timer:
+                return
+
+            self._timer        = threading.Timer(SAVE_DELAY, self.save)
+            self._timer.daemon = True
+            self._timer.start()
+
+
+    def save(self) -> None:
+        """Write the queued messages now. The file is written without
+        holding `lock`, pipelines can keep sending meanwhile."""
+        saved: Dict[str, Dict[str, List[dict]]] = {}
+
+        with self._save_lock:
+            with self.lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+
+                for (user_id, room_id), pipeline in self.pipelines.items():
+                    if pipeline.queue:
+                        saved.setdefault(user_id, {})[room_id] = \
+                            list(pipeline.queue)
+
+            with AtomicFile(self.path, "w") as new:
+                new.write(json.dumps(saved, indent=4, ensure_ascii=False))
+
+
+    def get_pipeline(self, user_id: str, room_id: str) -> SendPipeline:
+        with self.lock:
+            if (user_id, room_id) not in self.pipelines:
+                self.pipelines[user_id, room_id] = \
+                    SendPipeline(self, user_id, room_id)
+
+            return self.pipelines[user_id, room_id]
+
+
+    def pending(self, user_id: str, room_id: str = "") -> List[dict]:
+        "Return queued messages for `user_id`, or a room of `user_id`."
+        with self.lock:
+            return [msg for (uid, rid), pipe in self.pipelines.items()
+                    if uid == user_id and (not room_id or rid == room_id)
+                    for msg in pipe.queue]
+
+
+    def enqueue(self, msg: Message) -> None:
+        "Save `msg` and wake up the pipeline for its sender and room."
+        msg.txn_id = msg.txn_id or new_txn_id()
+        pipeline   = self.get_pipeline(msg.sender_id, msg.room_id)
+
+        with self.lock:
+            pipeline.queue.append({
+                "txn_id":         msg.txn_id,
+                "markdown":       msg.markdown,
+                "html":           msg.html,
+                "ms_since_epoch": msg.ms_since_epoch,
+            })
+            self.save_later()
+
+        pipeline.wake_up()
+
+
+    def wake_up(self, user_id: str) -> None:
+        """Wake up all pipelines with queued messages for `user_id`,
+        pipelines waiting after a transient error retry now."""
+        with self.lock:
+            pipelines = [p for (uid, _), p in self.pipelines.items()
+                         if uid == user_id and p.queue]
+
+        for pipeline in pipelines:
+            pipeline.wake_up(retry_now=True)
+
+
+    def on_login(self, client: MatrixClient) -> None:
+        self.wake_up(client.user_id)
+
+
+    def on_connection_state(self, user_id: str, state: str) -> None:
+        if state == "connected":
+            self.wake_up(user_id)
+
+
+def send_with_txn_id(client: MatrixClient, room_id: str, msg: dict) -> dict:
+    """Send a queued message dict, encrypting it if the room requires it.
+    Like `Room.send_html()`, but with our own transaction ID."""
+
+    room    = client.rooms[room_id]
+    etype   = "m.room.message"
+    content = room.get_html_content(msg["html"], body=msg["markdown"])
+
+    # pylint: disable=protected-access
+    if room.encrypted and client._encryption:
+        event   = {"content": content, "room_id": room_id, "type": etype}
+        etype   = "m.room.encrypted"
+        content = client.olm_device.megolm_build_encrypted_event(room, event)
+
+    return client.api.send_message_event(
+        room_id, etype, content, txn_id=msg["txn_id"]
+    )
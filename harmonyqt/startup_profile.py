@@ -0,0 +1,160 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+"Startup timeline printed when harmonyqt is ran with `--profile-startup`."
+
+import builtins
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.util import resolve_name
+from typing import Any, Iterator, List, Optional, Tuple
+
+from PyQt5.QtCore import QEvent, QObject
+
+# Imports and phases faster than that (in seconds) aren't shown
+MIN_SHOWN_DURATION = 0.002
+
+_PROFILE: Optional["StartupProfile"] = None
+
+
+class StartupProfile(QObject):
+    """Record the time taken by each module import and startup phase
+    in the main thread, until the main window is painted for the first
+    time."""
+
+    def __init__(self, started_at: float) -> None:
+        super().__init__()
+        self.started_at = started_at
+
+        # [(start time since started_at, duration, depth, label)]
+        self.entries: List[Tuple[float, float, int, str]] = []
+
+        self._depth:           int = 0
+        self._original_import: Any = None
+
+
+    @property
+    def running(self) -> bool:
+        return bool(self._original_import)
+
+
+    def start(self) -> None:
+        self._original_import = builtins.__import__
+        builtins.__import__   = self._import
+
+
+    def stop(self) -> None:
+        if self._original_import:
+            builtins.__import__   = self._original_import
+            self._original_import = None
+
+
+    @contextmanager
+    def phase(self, label: str) -> Iterator[int]:
+        "Record the time taken by the block, yield the entry's index."
+        index   = len(self.entries)
+        started = time.perf_counter()
+        self.entries.append((started - self.started_at, 0, self._depth, label))
+        self._depth += 1
+
+        try:
+            yield index
+        finally:
+            self._depth          -= 1
+            start, _, depth, label = self.entries[index]
+            self.entries[index]    = (start, time.perf_counter() - started,
+                                      depth, label)
+
+
+    def add(self, label: str, start: float, duration: float) -> None:
+        "Add an entry for something timed in another thread."
+        self.entries.append((start - self.started_at, duration, self._depth,
+                             label))
+
+
+    def _import(self, name: str, globals_: Optional[dict] = None,
+                locals_: Optional[dict] = None, fromlist: Tuple = (),
+                level: int = 0) -> Any:
+        args = (name, globals_, locals_, fromlist, level)
+
+        if threading.current_thread() is not threading.main_thread():
+            return self._original_import(*args)
+
+        try:
+            package  = (globals_ or {}).get("__package__")
+            resolved = resolve_name("." * level + name, package)
+        except (ImportError, ValueError):
+            return self._original_import(*args)
+
+        # from package import submodule1, submodule2
+        maybe_new = [f"{resolved}.{attr}" for attr in fromlist or ()
+                     if f"{resolved}.{attr}" not in sys.modules]
+
+        if resolved not in sys.modules:
+            maybe_new.insert(0, resolved)
+
+        if not maybe_new:
+            return self._original_import(*args)
+
+        with self.phase(f"import {resolved}") as index:
+            module = self._original_import(*args)
+
+        # Names in fromlist can be other objects than submodules
+        new = [name for name in maybe_new if name in sys.modules]
+        if new:
+            start, duration, depth, _ = self.entries[index]
+            self.entries[index]       = (start, duration, depth,
+                                         f"import {', '.join(new)}")
+        return module
+
+
+    def report(self) -> str:
+        lines = [
+            f"{start:8.3f}s {duration * 1000:9.1f}ms  {'  ' * depth}{label}"
+            for start, duration, depth, label in self.entries
+            if duration >= MIN_SHOWN_DURATION
+        ]
+        total = time.perf_counter() - self.started_at
+        lines.append(f"{total:8.3f}s {'':11}  First window paint")
+        return "\n".join(("Startup timeline:", *lines))
+
+
+    def watch_first_paint(self, widget: QObject) -> None:
+        "Print the report and stop profiling once `widget` is painted."
+        widget.installEventFilter(self)
+
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        # pylint: disable=invalid-name
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            self.stop()
+            print(self.report(), file=sys.stderr)
+
+        return False
+
+
+def start(started_at: float) -> StartupProfile:
+    global _PROFILE  # pylint: disable=global-statement
+    _PROFILE = StartupProfile(started_at)
+    _PROFILE.start()
+    return _PROFILE
+
+
+@contextmanager
+def phase(label: str) -> Iterator[None]:
+    "Record a startup phase if `--profile-startup` was passed, else no-op."
+    if not _PROFILE or not _PROFILE.running:
+        yield
+        return
+
+    with _PROFILE.phase(label):
+        yield
+
+
+def record(label: str, start: float, duration: float) -> None:
+    "Record something timed in another thread, if profiling is running."
+    if _PROFILE and _PROFILE.running:
+        _PROFILE.add(label, start, duration)
@@ -0,0 +1,216 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import copy
+import threading
+import time
+from typing import Callable, Optional, Set
+
+from requests import Session
+
+from matrix_client.client import MatrixClient
+
+ErrorHandler = Callable[[BaseException], None]
+
+# Possible values passed to SyncWatchdog.on_state_change
+STATES = ("connecting", "connected", "stalled", "disconnected")
+
+
+class StaleSyncError(Exception):
+    "Raised in a sync thread that has been replaced by a newer one."
+
+
+class SyncWatchdog:
+    """Run and supervise the sync loop of a `MatrixClient`.
+
+    `MatrixClient.listen_forever()` only reacts to exceptions: a long-poll
+    that silently hangs after a network drop freezes the client until the
+    socket finally times out.
+
+    The watchdog runs its own sync thread, whose requests use an HTTP session
+    not shared with the client's other API calls. When no response arrives
+    `stall_grace` seconds after the `timeout_ms` the server was asked to hold
+    the request for, the thread is abandoned (its late response will be
+    discarded) and a new one immediately starts with a fresh session.
+    Failed requests are retried with an exponential backoff.
+
+    `on_state_change` is called with one of `STATES` when the connection
+    state changes, `on_error` with exceptions raised during sync.
+    Both are called from the watchdog's threads."""
+
+    def __init__(self,
+                 client:          MatrixClient,
+                 timeout_ms:      int   = 10_000,
+                 stall_grace:     float = 5,
+                 check_interval:  float = 1,
+                 max_retry_delay: float = 30,
+                 on_state_change: Optional[Callable[[str], None]] = None,
+                 on_error:        Optional[ErrorHandler]           = None,
+                ) -> None:
+        self.client          = client
+        self.timeout_ms      = timeout_ms
+        self.stall_grace     = stall_grace
+        self.check_interval  = check_interval
+        self.max_retry_delay = max_retry_delay
+        self.on_state_change = on_state_change
+        self.on_error        = on_error
+
+        self.state:    str = "connecting"
+        self.restarts: int = 0
+
+        self._lock            = threading.RLock()
+        self._stop            = threading.Event()
+        self._wake            = threading.Event()
+        self._request_started: Optional[float]            = None
+        self._sync_thread:     Optional[threading.Thread] = None
+        self._abandoned:       Set[threading.Thread]      = set()
+
+        # Closing a stalled session must not abort other requests in flight
+        self._sync_api         = copy.copy(client.api)
+        self._sync_api.session = Session()
+
+        self._wrap_api_sync()
+
+
+    @property
+    def stall_after(self) -> float:
+        "Seconds an in-flight sync request can last before being abandoned."
+        return self.timeout_ms / 1000 + self.stall_grace
+
+
+    def start(self) -> None:
+        self.restart()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+        with self._lock:
+            if self._sync_thread:
+                self._abandoned.add(self._sync_thread)
+                self._sync_thread = None
+
+
+    def restart(self) -> None:
+        "Abandon the current sync request if any and start a new one."
+        with self._lock:
+            if self._stop.is_set():
+                return
+
+            old_session: Optional[Session] = None
+
+            if self._sync_thread:
+                self._abandoned.add(self._sync_thread)
+                self.restarts += 1
+
+                # The hanging connection may be reused by the pool otherwise
+                old_session            = self._sync_api.session
+                self._sync_api.session = Session()
+
+            self._request_started = None
+            self._sync_thread     = threading.Thread(target=self._listen,
+                                                     daemon=True)
+            self._sync_thread.start()
+
+        if old_session:
+            old_session.close()
+
+
+    def reconnect_now(self) -> None:
+        "Skip the current retry delay after a failed sync, if there's one."
+        self._wake.set()
+
+
+    def _set_state(self, state: str) -> None:
+        assert state in STATES
+
+        with self._lock:
+            if state == self.state:
+                return
+            self.state = state
+
+        if self.on_state_change:
+            self.on_state_change(state)
+
+
+    def _is_current(self) -> bool:
+        return threading.current_thread() is self._sync_thread
+
+
+    def _wrap_api_sync(self) -> None:
+        shared = self.client.api.sync
+
+        def sync(*args, **kwargs) -> dict:
+            thread = threading.current_thread()
+
+            if thread in self._abandoned:
+                raise StaleSyncError()
+
+            if thread is not self._sync_thread:  # not called by us
+                return shared(*args, **kwargs)
+
+            with self._lock:
+                self._request_started = time.monotonic()
+
+            try:
+                response = self._sync_api.sync(*args, **kwargs)
+            except Exception:
+                if self._is_current():
+                    with self._lock:
+                        self._request_started = None
+                    self._set_state("disconnected")
+                raise
+
+            if not self._is_current():
+                raise StaleSyncError()
+
+            with self._lock:
+                self._request_started = None
+
+            self._set_state("connected")
+            return response
+
+        self.client.api.sync = sync
+
+
+    def _listen(self) -> None:
+        retry_delay = 0.0
+
+        try:
+            while not self._stop.is_set() and self._is_current():
+                try:
+                    # pylint: disable=protected-access
+                    self.client._sync(self.timeout_ms)
+                except StaleSyncError:
+                    return
+                except Exception as err:  # pylint: disable=broad-except
+                    if not self._is_current():
+                        return
+
+                    if self.on_error:
+                        self.on_error(err)
+
+                    retry_delay = min(max(retry_delay * 2, 1),
+                                      self.max_retry_delay)
+                    self._wake.wait(retry_delay)
+                    self._wake.clear()
+                else:
+                    retry_delay = 0
+        finally:
+            with self._lock:
+                self._abandoned.discard(threading.current_thread())
+
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            with self._lock:
+                started = self._request_started
+
+            if started is None or \
+               time.monotonic() - started < self.stall_after:
+                continue
+
+            self._set_state("stalled")
+            self.restart()
@@ -5,19 +5,20 @@ import abc
 from pathlib import Path
 from typing import Any, Dict, List, Sequence, Tuple
 
-from pkg_resources import resource_filename
 from PyQt5.QtGui import QIcon
 
 from . import __about__
 
-_PKG = __about__.__name__
+# pkg_resources.resource_filename() would take longer to import than to load
+# all themes and icons.
+_PKG_DIR = Path(__about__.__file__).resolve().parent
 
 
 class ResourceDir(abc.ABC):
     def __init__(self, base_dir: str, res_name: str) -> None:
         self.name:      str  = res_name
         self.dir:       str  = f"{base_dir}/{res_name}"
-        self.base_path: Path = Path(resource_filename(_PKG, self.dir))
+        self.base_path: Path = _PKG_DIR / self.dir
 
         # {relative path: {ext: (path, file content as bytes)}}
         self._cache: Dict[str, Dict[str, Tuple[Path, Any]]] = {}
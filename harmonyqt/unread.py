@@ -0,0 +1,208 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import re
+from threading import Lock
+from typing import Deque, Dict, Set, Tuple
+from urllib.parse import quote
+
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+
+from . import main_window
+
+# Milliseconds during which count changes are collected before being emitted
+FLUSH_INTERVAL = 250
+
+# Max number of unread messages remembered per room
+MAX_COUNTED = 999
+
+COUNTED_TYPES = ("m.room.message", "m.room.encrypted")
+
+# Mention of an user in formatted_body, {} is the user ID pattern
+PILL_HREF = r"href=[\"']https://matrix\.to/#/({})[\"'?]"
+
+# (user_id, room_id): (unread messages, highlights)
+Counts = Dict[Tuple[str, str], Tuple[int, int]]
+
+
+class _SignalObject(QObject):
+    # Counts of the rooms that changed since the last emission
+    counts_changed = pyqtSignal(dict)
+    # Emitted from sync threads to start the flush timer in the GUI thread
+    flush_needed = pyqtSignal()
+
+
+class RoomUnread:
+    "Unread message event IDs of a room, oldest first."
+
+    __slots__ = ("events", "highlights")
+
+    def __init__(self) -> None:
+        # [(event_id, is_highlight)]
+        self.events:     Deque[Tuple[str, bool]] = Deque()
+        self.highlights: int                     = 0
+
+
+    def add(self, event_id: str, highlight: bool) -> None:
+        if len(self.events) >= MAX_COUNTED:
+            self.highlights -= self.events.popleft()[1]
+
+        self.events.append((event_id, highlight))
+        self.highlights += highlight
+
+
+    def read_until(self, event_id: str) -> None:
+        """Forget events up to `event_id`. If it's not an unread message,
+        e.g. a state event or our own message, it's assumed to be the newest
+        event and everything is forgotten."""
+        if not any(eid == event_id for eid, _ in self.events):
+            self.events.clear()
+            self.highlights = 0
+            return
+
+        while self.events:
+            eid, highlight   = self.events.popleft()
+            self.highlights -= highlight
+            if eid == event_id:
+                return
+
+
+class UnreadCounter:
+    """Count unread messages and highlights of every room.
+
+    Events and read receipts are handled in the sync threads that receive
+    them. Changed rooms are collected and their counts emitted together
+    with `signals.counts_changed` every `FLUSH_INTERVAL` ms at most,
+    whatever the number of rooms and events."""
+
+    def __init__(self) -> None:
+        self.signals = _SignalObject()
+        self._lock   = Lock()
+
+        self._rooms: Dict[Tuple[str, str], RoomUnread] = {}
+        self._dirty: Set[Tuple[str, str]]              = set()
+
+        self._timer = QTimer(self.signals)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FLUSH_INTERVAL)
+        self._timer.timeout.connect(self.flush)
+        self.signals.flush_needed.connect(self._timer.start)
+
+        ev_sig = main_window().events.signals
+        ev_sig.new_unique_event.connect(self.on_event, Qt.DirectConnection)
+        ev_sig.left_room.connect(self.forget_room)
+        ev_sig.account_gone.connect(self.forget_account)
+
+
+    def counts(self, user_id: str, room_id: str) -> Tuple[int, int]:
+        "Return the unread messages and highlights count of a room."
+        with self._lock:
+            room = self._rooms.get((user_id, room_id))
+            return (len(room.events), room.highlights) if room else (0, 0)
+
+
+    @staticmethod
+    def is_highlight(user_id: str, event: dict) -> bool:
+        """Return whether the message mentions `user_id`: a pill to it in
+        the formatted body, or its localpart or display name in the room
+        as a whole word in the body."""
+        content = event["content"]
+        body    = content.get("body")
+        if not isinstance(body, str):
+            return False
+
+        formatted = content.get("formatted_body")
+        ids       = (re.escape(user_id), re.escape(quote(user_id, safe="")))
+
+        if isinstance(formatted, str) and \
+           re.search(PILL_HREF.format("|".join(ids)), formatted):
+            return True
+
+        localpart = user_id.split(":")[0][1:]
+        dispname  = main_window().display_names.sender_name(
+            user_id, event["room_id"]
+        )
+        names = "|".join(re.escape(n) for n in {localpart, dispname} if n)
+
+        return bool(re.search(rf"(?<!\w)({names})(?!\w)", body,
+                              re.IGNORECASE))
+
+
+    def on_event(self, receiver_id: str, event: dict) -> None:
+        if event["type"] not in COUNTED_TYPES:
+            return
+
+        key = (receiver_id, event["room_id"])
+
+        # Our own messages or the chat being shown means the room was read
+        if event["sender"] == receiver_id or \
+           key in main_window().visible_chat_docks:
+            self.mark_read(*key)
+            return
+
+        highlight = self.is_highlight(receiver_id, event)
+
+        with self._lock:
+            self._rooms.setdefault(key, RoomUnread()).add(event["event_id"],
+                                                          highlight)
+            self._set_dirty(key)
+
+
+    def on_receipt(self, receiver_id: str, event: dict) -> None:
+        "Handle a `m.receipt` event, called by `EventManager`."
+        for event_id, receipts in event["content"].items():
+            if receiver_id not in receipts.get("m.read", {}):
+                continue
+
+            key = (receiver_id, event["room_id"])
+
+            with self._lock:
+                room = self._rooms.get(key)
+                if room and room.events:
+                    room.read_until(event_id)
+                    self._set_dirty(key)
+
+
+    def mark_read(self, user_id: str, room_id: str) -> None:
+        key = (user_id, room_id)
+
+        with self._lock:
+            room = self._rooms.pop(key, None)
+            if room and room.events:
+                self._set_dirty(key)
+
+
+    def _set_dirty(self, key: Tuple[str, str]) -> None:
+        "Must be called with the lock held."
+        if not self._dirty:
+            self.signals.flush_needed.emit()
+
+        self._dirty.add(key)
+
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            counts: Counts     = {}
+
+            for key in dirty:
+                room        = self._rooms.get(key)
+                counts[key] = (len(room.events), room.highlights) \
+                              if room else (0, 0)
+
+        if counts:
+            self.signals.counts_changed.emit(counts)
+
+
+    def forget_room(self, user_id: str, room_id: str) -> None:
+        with self._lock:
+            self._rooms.pop((user_id, room_id), None)
+            self._dirty.discard((user_id, room_id))
+
+
+    def forget_account(self, user_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._rooms if k[0] == user_id]:
+                del self._rooms[key]
+
+            self._dirty = {k for k in self._dirty if k[0] != user_id}
@@ -1,30 +1,365 @@
 # Copyright 2018 miruka
 # This file is part of harmonyqt, licensed under GPLv3.
 
-from multiprocessing.pool import ThreadPool
-from typing import Dict, List
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
-from PyQt5.QtCore import QObject, QPoint, Qt, pyqtSignal
-from PyQt5.QtGui import QIcon, QKeyEvent, QMouseEvent
+from PyQt5.QtCore import (
+    QAbstractItemModel, QModelIndex, QPoint, Qt, QTimer, pyqtSignal
+)
+from PyQt5.QtGui import QFont, QIcon, QKeyEvent, QMouseEvent
 from PyQt5.QtWidgets import (
-    QAction, QHeaderView, QSizePolicy, QTreeWidget, QTreeWidgetItem
+    QAbstractItemView, QAction, QHeaderView, QSizePolicy, QTreeView
 )
 
 from harmonyqt import __about__, actions, app, main_window, shortcuts
 from harmonyqt.dialogs import AcceptRoomInvite
+from harmonyqt.executor import HIGH, LOW, Task
 from harmonyqt.menu import Menu
 from harmonyqt.scroller import Scroller
+from harmonyqt.unread import MAX_COUNTED
 from matrix_client.client import MatrixClient
 from matrix_client.room import Room
 
+# Milliseconds during which row changes are collected before being shown
+UPDATE_INTERVAL = 16
+
+# Internal pointer for the blank rows shown between accounts
+_BLANK = object()
+
+
+class Row:
+    "Base class for the accounts and rooms shown in an `UserTreeModel`."
+
+    def __init__(self, model: "UserTreeModel", name: str = "") -> None:
+        self.model:   "UserTreeModel" = model
+        self.parent:  Optional[Row]   = None
+        self.name:    str             = name
+        self.icon:    QIcon           = QIcon()  # second column indicator
+        self.tooltip: str             = ""
+
+        # Second column unread messages counter, shown if there's no icon
+        self.unread:     int = 0
+        self.highlights: int = 0
+
+        # Display name lookup waiting in the executor
+        self.name_task: Optional[Task] = None
+
+        # Sorted by key, the key of a child is its sort_key() when inserted
+        # or last moved.
+        self.children: List[Row]             = []
+        self.keys:     List[Tuple[str, str]] = []
+        self.key:      Tuple[str, str]       = ("", "")
+
+
+    @property
+    def sort_id(self) -> str:
+        return ""
+
+
+    def sort_key(self) -> Tuple[str, str]:
+        return (self.name.lower(), self.sort_id)
+
+
+    def resolve_name(self, get_name: Callable[[], str]) -> None:
+        """Find the row's display name with the executor.
+        Tasks for visible rows are prioritized by the next model flush."""
+        if self.name_task:
+            self.name_task.cancel()
+
+        self.name_task = main_window().executor.submit(
+            get_name,
+            kind     = "display_name",
+            priority = LOW,
+            callback = lambda name: self.model.name_resolved.emit(self, name)
+        )
+
+
+    def cancel_tasks(self) -> None:
+        if self.name_task:
+            self.name_task.cancel()
+
+        for child in self.children:
+            child.cancel_tasks()
+
+
+class UserTreeModel(QAbstractItemModel):
+    """Accounts and their rooms, each level sorted by display name.
+
+    A blank row separates accounts: top-level row `2 * i` is the account at
+    index `i` and odd rows are virtual blank rows.
+
+    Rows are inserted at their sorted position. Name and appearance changes
+    are collected, then applied together after `UPDATE_INTERVAL` ms;
+    a renamed room is moved to its new position instead of sorting all
+    rows again."""
+
+    # Can be emitted from any thread
+    name_resolved = pyqtSignal(object, str)  # Row, new name
+
+
+    def __init__(self, parent: "UserTree") -> None:
+        super().__init__(parent)
+        self.tree: "UserTree" = parent
+        self.root: Row        = Row(self)
+
+        self._names:   Dict[Row, str] = {}
+        self._changed: Set[Row]       = set()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(UPDATE_INTERVAL)
+        self._timer.timeout.connect(self.flush)
+
+        self.name_resolved.connect(self.set_name)
+
+
+    def row_at(self, index: QModelIndex) -> Optional[Row]:
+        "Return the Row for `index`, `None` for invalid indexes and blanks."
+        if not index.isValid():
+            return None
+
+        row = index.internalPointer()
+        return row if isinstance(row, Row) else None
+
+
+    def index_of(self, row: Row, column: int = 0) -> QModelIndex:
+        if row is self.root or not row.parent:
+            return QModelIndex()
+
+        pos = bisect_left(row.parent.keys, row.key)
+        pos = pos * 2 if row.parent is self.root else pos
+        return self.createIndex(pos, column, row)
+
+
+    # Qt model API
+
+    def index(self, row: int, column: int,
+              parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+
+        parent_row = self.row_at(parent) or self.root
+
+        if parent_row is not self.root:
+            return self.createIndex(row, column, parent_row.children[row])
+
+        if row % 2:
+            return self.createIndex(row, column, _BLANK)
+
+        return self.createIndex(row, column, self.root.children[row // 2])
+
+
+    def parent(self, index: QModelIndex) -> QModelIndex:
+        # pylint: disable=arguments-differ
+        row = self.row_at(index)
+
+        if not row or row.parent is self.root:
+            return QModelIndex()
+
+        return self.index_of(row.parent)
+
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.column() > 0:
+            return 0
+
+        if not parent.isValid():
+            return max(0, len(self.root.children) * 2 - 1)
+
+        row = self.row_at(parent)
+        return len(row.children) if row else 0
+
+
+    def columnCount(self, _: QModelIndex = QModelIndex()) -> int:
+        return 2  # avatar/name; unread msg num/invite/connection indicator
+
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        row = self.row_at(index)
+        if not row:
+            return None
+
+        if role == Qt.DisplayRole and index.column() == 0:
+            return row.name
+
+        if role == Qt.DecorationRole and index.column() == 1:
+            return row.icon
+
+        if role == Qt.DisplayRole and index.column() == 1 and \
+           row.unread and row.icon.isNull():
+            return "999+" if row.unread >= MAX_COUNTED else str(row.unread)
+
+        if role == Qt.FontRole and index.column() == 1 and row.highlights:
+            font = QFont()
+            font.setBold(True)
+            return font
+
+        if role == Qt.ToolTipRole:
+            return row.tooltip
+
+        if role == Qt.TextAlignmentRole and index.column() == 1:
+            return Qt.AlignRight
+
+        return None
+
+
+    def flags(self, index: QModelIndex) -> Qt.ItemFlags:
+        row = self.row_at(index)
+
+        if not index.isValid():
+            return Qt.NoItemFlags
+
+        if not row:  # blank row
+            return Qt.NoItemFlags | Qt.ItemNeverHasChildren
+
+        if row.parent is self.root:
+            return super().flags(index)
+
+        return super().flags(index) | Qt.ItemNeverHasChildren
+
+
+    # Modifications
+
+    def _span(self, parent: Row, pos: int, count: int) -> Tuple[int, int]:
+        """Return the first and last visible rows taken by the child at `pos`
+        of `parent`, which has `count` children including that one."""
+        if parent is not self.root:
+            return (pos, pos)
+
+        # Account rows come with a blank row before them, or after for the
+        # first one.
+        if count == 1:
+            return (0, 0)
+
+        return (0, 1) if pos == 0 else (pos * 2 - 1, pos * 2)
+
+
+    def insert(self, row: Row, parent: Optional[Row] = None) -> None:
+        parent  = parent or self.root
+        row.key = row.sort_key()
+        pos     = bisect_left(parent.keys, row.key)
+
+        first, last = self._span(parent, pos, len(parent.children) + 1)
+        self.beginInsertRows(self.index_of(parent), first, last)
+        row.parent = parent
+        parent.keys.insert(pos, row.key)
+        parent.children.insert(pos, row)
+        self.endInsertRows()
+
+
+    def remove(self, row: Row) -> None:
+        parent = row.parent
+        if not parent:
+            return
 
-class UserTree(QTreeWidget):
+        pos = bisect_left(parent.keys, row.key)
+
+        first, last = self._span(parent, pos, len(parent.children))
+        self.beginRemoveRows(self.index_of(parent), first, last)
+        del parent.keys[pos]
+        del parent.children[pos]
+        row.parent = None
+        self.endRemoveRows()
+
+        row.cancel_tasks()
+
+
+    def set_name(self, row: Row, name: str) -> None:
+        self._names[row] = name
+        self._timer.start()
+
+
+    def row_changed(self, row: Row) -> None:
+        "Schedule a repaint of `row` after its icon or tooltip changed."
+        self._changed.add(row)
+        self._timer.start()
+
+
+    def flush(self) -> None:
+        names,   self._names   = self._names,   {}
+        changed, self._changed = self._changed, set()
+        resort_root            = False
+
+        for row, name in names.items():
+            if not row.parent or name == row.name:
+                continue
+
+            row.name = name
+            changed.add(row)
+
+            if row.parent is self.root:
+                resort_root = True
+            else:
+                self._move(row)
+
+        if resort_root:
+            self._resort_root()
+
+        for row in changed:
+            if row.parent:
+                self.dataChanged.emit(self.index_of(row, 0),
+                                      self.index_of(row, 1))
+
+        # Rows added since the last flush may have been scrolled into view
+        self.tree.prioritize_visible_rows()
+
+
+    def _move(self, row: Row) -> None:
+        "Move a room row to its sorted position after its name changed."
+        parent  = row.parent
+        old     = bisect_left(parent.keys, row.key)
+        new_key = row.sort_key()
+
+        others = parent.keys[:old] + parent.keys[old + 1:]
+        new    = bisect_left(others, new_key)
+
+        if new == old:
+            row.key = parent.keys[old] = new_key
+            return
+
+        index = self.index_of(parent)
+        self.beginMoveRows(index, old, old, index, new + (new > old))
+        del parent.children[old]
+        row.key     = new_key
+        parent.keys = others
+        parent.keys.insert(new, new_key)
+        parent.children.insert(new, row)
+        self.endMoveRows()
+
+
+    def _resort_root(self) -> None:
+        "Sort account rows again, there are few and they rarely change."
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+
+        for row in self.root.children:
+            row.key = row.sort_key()
+
+        self.root.children.sort(key=lambda r: r.key)
+        self.root.keys = [r.key for r in self.root.children]
+
+        for index in persistent:
+            row = self.row_at(index)
+            if row and row.parent is self.root:
+                self.changePersistentIndex(
+                    index, self.index_of(row, index.column())
+                )
+
+        self.layoutChanged.emit()
+
+
+class UserTree(QTreeView):
     def __init__(self) -> None:
         super().__init__()
-        self.accounts:   Dict[str, "AccountRow"] = {}
-        self.blank_rows: List["BlankRow"]        = []
+        self.accounts: Dict[str, "AccountRow"] = {}
+
+        self.tree_model: UserTreeModel = UserTreeModel(self)
+        self.setModel(self.tree_model)
 
         self.scroller: Scroller = Scroller(self)
+        self.scroller.vbar.valueChanged.connect(self.prioritize_visible_rows)
+        self.expanded.connect(self.prioritize_visible_rows)
 
         main_window().shortcuts.add(shortcuts.Shortcut(
             name          = "Focus Accounts / Rooms",
@@ -34,12 +369,11 @@ class UserTree(QTreeWidget):
         ))
 
         self.setSizePolicy(QSizePolicy.Maximum, QSizePolicy.Expanding)
-        self.setColumnCount(2)  # avatar/name; unread msg num/invite indicator
         self.setUniformRowHeights(True)
         self.setAnimated(True)
         self.setAutoExpandDelay(500)
         self.setHeaderHidden(True)  # TODO: customizable cols
-        self.setSelectionMode(QTreeWidget.ExtendedSelection)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setExpandsOnDoubleClick(False)  # Handled by signals/events
         self.setIndentation(12)
 
@@ -59,6 +393,11 @@ class UserTree(QTreeWidget):
         ev_sig.room_rename.connect(self.on_rename_room)
         ev_sig.left_room.connect(self.on_left_room)
         ev_sig.account_change.connect(self.on_account_change)
+        ev_sig.connection_state.connect(self.on_connection_state)
+
+        main_window().unread.signals.counts_changed.connect(
+            self.on_unread_counts
+        )
 
         self.actions: List[QAction] = []
         self.init_actions()
@@ -82,47 +421,39 @@ class UserTree(QTreeWidget):
             return
 
         row = AccountRow(self, user_id)
-        row.signals.ui_updated.connect(self.sort_account_rows)
         self.accounts[user_id] = row
+        self.tree_model.insert(row)
+        row.update_ui()
 
 
-    def sort_account_rows(self) -> None:
-        root = self.invisibleRootItem()
-        root.sortChildren(0, Qt.AscendingOrder)
+    def del_account(self, user_id: str) -> None:
+        if user_id not in self.accounts:
+            return
 
-        for row in self.blank_rows:
-            root.removeChild(row)
+        self.tree_model.remove(self.accounts.pop(user_id))
 
-        for row in self.accounts.values():
-            index = root.indexOfChild(row)
-            if index > 0:
-                blank = BlankRow()
-                root.insertChild(index, blank)
-                self.blank_rows.append(blank)
 
+    def row_at(self, index: QModelIndex) -> Optional[Row]:
+        return self.tree_model.row_at(index)
 
-    def del_account(self, user_id: str) -> None:
-        if user_id not in self.accounts:
-            return
 
-        to_del: AccountRow = self.accounts[user_id]
-        root               = self.invisibleRootItem()
+    def prioritize_visible_rows(self, *_) -> None:
+        "Look up names of the rows scrolled into view before other ones."
+        index  = self.indexAt(QPoint(0, 0))
+        bottom = self.viewport().rect().bottom()
 
-        for row in self.blank_rows:
-            if root.indexOfChild(row) == root.indexOfChild(to_del) - 1:
-                root.removeChild(row)
+        while index.isValid() and self.visualRect(index).top() <= bottom:
+            row = self.row_at(index)
 
-        root.removeChild(to_del)
-        del self.accounts[user_id]
+            if row and row.name_task:
+                row.name_task.set_priority(HIGH)
 
-        first = root.child(0)
-        if isinstance(first, BlankRow):
-            root.removeChild(first)
+            index = self.indexBelow(index)
 
 
     def on_context_menu_request(self, position: QPoint) -> None:
-        selected = [self.itemFromIndex(s) for s in self.selectedIndexes()
-                    if s.column() == 0 and not isinstance(s, BlankRow)]
+        selected = [self.row_at(i) for i in self.selectedIndexes()
+                    if i.column() == 0 and self.row_at(i)]
 
         acts: List[QAction] = []
         for row in selected:
@@ -158,16 +489,41 @@ class UserTree(QTreeWidget):
         self.accounts[user_id].update_ui(new_display_name, new_avatar_url)
 
 
+    def on_connection_state(self, user_id: str, state: str) -> None:
+        if user_id in self.accounts:
+            self.accounts[user_id].set_connection_state(state)
+
+
+    def on_unread_counts(self, counts: dict) -> None:
+        changed_accounts: Set[AccountRow] = set()
+
+        for (user_id, room_id), (unread, highlights) in counts.items():
+            account = self.accounts.get(user_id)
+            room    = account.rooms.get(room_id) if account else None
+
+            if room:
+                room.unread, room.highlights = unread, highlights
+                self.tree_model.row_changed(room)
+                changed_accounts.add(account)
+
+        for account in changed_accounts:
+            account.unread     = sum(r.unread for r in account.rooms.values())
+            account.highlights = sum(r.highlights
+                                     for r in account.rooms.values())
+            self.tree_model.row_changed(account)
+
+
     def really_clear_selection(self) -> None:
         self.clearSelection()
-        self.setCurrentItem(None)
+        self.setCurrentIndex(QModelIndex())
 
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
         super().keyPressEvent(event)
 
         if event.key() in (Qt.Key_Return, Qt.Key_Enter):  # Enter = keypad
-            self.activate_row(self.currentItem(), event.modifiers())
+            self.activate_row(self.row_at(self.currentIndex()),
+                              event.modifiers())
 
         elif event.key() == Qt.Key_Escape:
             self.really_clear_selection()
@@ -183,7 +539,7 @@ class UserTree(QTreeWidget):
            btn == Qt.LeftButton and mods != Qt.NoModifier:
             return
 
-        clicked_row = self.itemAt(event.pos())
+        clicked_row = self.row_at(self.indexAt(event.pos()))
         self.activate_row(clicked_row, mods, btn == Qt.MiddleButton)
 
         if not clicked_row:
@@ -191,7 +547,7 @@ class UserTree(QTreeWidget):
 
 
     def activate_row(self,
-                     row:             QTreeWidgetItem,
+                     row:             Optional[Row],
                      kb_modifiers:    Qt.KeyboardModifiers,
                      middle_click: bool = False) -> None:
         if hasattr(row, "on_activation"):
@@ -199,34 +555,25 @@ class UserTree(QTreeWidget):
             self.really_clear_selection()
 
 
-class BlankRow(QTreeWidgetItem):
-    def __init__(self) -> None:
-        # Don't take a parent or sorting won't work correctly
-        super().__init__()
-        self.setFlags(Qt.NoItemFlags | Qt.ItemNeverHasChildren)
-
-
-class _AccountRowSignals(QObject):
-    ui_updated = pyqtSignal()
-
-
-class AccountRow(QTreeWidgetItem):
-    def __init__(self, parent: UserTree, user_id: str) -> None:
-        super().__init__(parent)
-        self.user_tree: UserTree           = parent
+class AccountRow(Row):
+    def __init__(self, tree: UserTree, user_id: str) -> None:
+        super().__init__(tree.tree_model, name=user_id)
+        self.user_tree: UserTree           = tree
         self.client:    MatrixClient       = main_window().accounts[user_id]
         self.rooms:     Dict[str, RoomRow] = {}
 
-        self.signals = _AccountRowSignals()
-        self._pool   = ThreadPool(1)
-
         self.auto_expanded_once: bool = False
-        self.update_ui()
+        self.connection_state:   str  = "connecting"
 
         self.actions: List[QAction] = []
         self.init_actions()
 
 
+    @property
+    def sort_id(self) -> str:
+        return self.client.user_id
+
+
     def init_actions(self) -> None:
         self.actions = [
             actions.NewChat(self.user_tree, self.client.user_id),
@@ -239,22 +586,33 @@ class AccountRow(QTreeWidgetItem):
 
 
     def update_ui(self, new_display_name: str = "", _: str = "") -> None:
-        self.setToolTip(0, self.client.user_id)
-
-        def update(name: str) -> None:
-            self.setText(0, name)
-            self.signals.ui_updated.emit()
+        self.set_connection_state(self.connection_state)  # tooltips
 
         if new_display_name:
-            update(new_display_name)
+            self.model.set_name(self, new_display_name)
         else:
-            self._pool.apply_async(self.client.user.get_display_name,
-                                   callback = update)
+            self.resolve_name(
+                lambda: main_window().display_names.user_name(self.client)
+            )
+
+
+    def set_connection_state(self, state: str) -> None:
+        self.connection_state = state
+        icon = {"stalled":      "status_away",
+                "disconnected": "status_offline"}.get(state)
+
+        self.icon    = main_window().icons.icon(icon) if icon else QIcon()
+        self.tooltip = self.client.user_id
+
+        if icon:
+            self.tooltip += f"\nConnection {state}, reconnecting..."
+
+        self.model.row_changed(self)
 
 
     def on_activation(self, *_) -> None:
-        expanded = self.isExpanded()
-        self.setExpanded(not expanded)
+        index = self.model.index_of(self)
+        self.user_tree.setExpanded(index, not self.user_tree.isExpanded(index))
 
 
     def add_room(self, room_id: str,
@@ -264,43 +622,31 @@ class AccountRow(QTreeWidgetItem):
             self.rooms[room_id].update_ui()
             return
 
-        self.rooms[room_id] = RoomRow(self, room_id,
-                                      invite_by, display_name, name, alias)
+        row = RoomRow(self, room_id, invite_by, name, alias)
+        self.rooms[room_id] = row
+        self.model.insert(row, self)
+        row.update_ui(display_name)
 
         if not self.auto_expanded_once:
-            self.setExpanded(True)  # TODO: unless user collapsed manually
+            # TODO: unless user collapsed manually
+            self.user_tree.expand(self.model.index_of(self))
             self.auto_expanded_once = True
 
 
     def del_room(self, room_id: str) -> None:
         if room_id in self.rooms:
-            self.removeChild(self.rooms[room_id])
-            del self.rooms[room_id]
+            self.model.remove(self.rooms.pop(room_id))
 
 
-    def sort_room_rows(self) -> None:
-        self.sortChildren(0, Qt.AscendingOrder)
-
-
-class _RoomRowSignals(QObject):
-    ui_updated = pyqtSignal()
-
-
-class RoomRow(QTreeWidgetItem):
+class RoomRow(Row):
     def __init__(self, parent: AccountRow, room_id: str,
-                 invite_by: str = "", display_name: str = "",
-                 name:      str = "", alias:        str = "") -> None:
-        super().__init__(parent)
-        self.setFlags(self.flags() | Qt.ItemNeverHasChildren)
+                 invite_by: str = "", name: str = "", alias: str = ""
+                ) -> None:
+        super().__init__(parent.model, name=room_id)
 
         self.account_row: AccountRow = parent
         self.invite_by:   str        = invite_by
 
-        self.signals = _RoomRowSignals()
-        self.signals.ui_updated.connect(self.account_row.sort_room_rows)
-
-        self._pool = ThreadPool(1)
-
         if invite_by:
             self.room: Room           = Room(parent.client, room_id)
             self.room.name            = self.room.name            or name
@@ -308,9 +654,6 @@ class RoomRow(QTreeWidgetItem):
         else:
             self.room: Room = parent.client.rooms[room_id]
 
-        self.setTextAlignment(1, Qt.AlignRight)  # msg unread/invite indicator
-        self.update_ui(display_name)
-
         self.actions_invite: List[QAction] = []
         self.actions_normal: List[QAction] = []
         self.init_actions()
@@ -330,6 +673,11 @@ class RoomRow(QTreeWidgetItem):
         ]
 
 
+    @property
+    def sort_id(self) -> str:
+        return self.room.room_id
+
+
     def get_context_menu_actions(self) -> List[QAction]:
         return self.actions_invite if self.invite_by else self.actions_normal
 
@@ -338,10 +686,10 @@ class RoomRow(QTreeWidgetItem):
         tooltips = self.room.aliases + [self.room.room_id]
 
         if self.invite_by:
-            self.setIcon(1, main_window().icons.icon("indicator_invite"))
+            self.icon = main_window().icons.icon("indicator_invite")
             tooltips.insert(0, f"Pending invitation from {self.invite_by}")
         else:
-            self.setIcon(1, QIcon())
+            self.icon = QIcon()
 
         tooltips.append(
             "\nMiddle click to open in a new tab\n"
@@ -349,23 +697,15 @@ class RoomRow(QTreeWidgetItem):
             "Ctrl + Middle click to open in a vertical split"
         )
 
-        tooltips = "\n".join(tooltips)
-        for col in range(self.columnCount()):
-            self.setToolTip(col, tooltips)
-
-        def update(name: str) -> None:
-            self.setText(0, name)
-            self.signals.ui_updated.emit()
+        self.tooltip = "\n".join(tooltips)
+        self.model.row_changed(self)
 
         if invite_display_name:
-            update(invite_display_name)
+            self.model.set_name(self, invite_display_name)
         else:
-            if not self.text(0).strip():
-                self.setText(0, self.room.room_id)
-
-            # Raises exception for rooms we're invited to but not joined
-            self._pool.apply_async(lambda: self.room.display_name,
-                                   callback = update)
+            self.resolve_name(lambda: main_window().display_names.room_name(
+                self.account_row.client, self.room
+            ))
 
 
     def on_activation(self,
@@ -376,7 +716,7 @@ class RoomRow(QTreeWidgetItem):
 
         if self.invite_by:
             dialog = AcceptRoomInvite(
-                main_window(), self.room, self.text(0), self.invite_by,
+                main_window(), self.room, self.name, self.invite_by,
             )
             dialog.exec()
 
@@ -2,7 +2,8 @@
 # This file is part of harmonyqt, licensed under GPLv3.
 
 import os
-from typing import Dict, Optional
+from threading import Lock
+from typing import Dict, Optional, Set, Tuple, Union
 
 from atomicfile import AtomicFile
 from PyQt5.QtCore import QStandardPaths as QSP
@@ -14,28 +15,94 @@ from . import data
 from .__about__ import __pkg_name__
 
 
-def get_standard_path(kind:            QSP.StandardLocation,
-                      file:            str,
-                      initial_content: Optional[str] = None) -> str:
-    relative_path = file.replace("/", os.sep)
+class PathResolver:
+    """Resolve paths in standard locations.
+
+    Directories are looked up and created once, and the path of files
+    once found or created is remembered. A file deleted after being
+    resolved isn't created again with its initial content."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        # {(location, relative dir): absolute dir}
+        self._dirs:    Dict[Tuple[int, str], str] = {}
+        # {(location, relative file path): absolute path}
+        self._files:   Dict[Tuple[int, str], str] = {}
+        self._created: Set[str]                   = set()
+
+
+    def ensure_dir(self, path: Union[str, os.PathLike]) -> str:
+        "Create directory `path` and its parents if not done before."
+        path = os.fspath(path)
+
+        with self._lock:
+            if path in self._created:
+                return path
+
+        os.makedirs(path, exist_ok=True)
+
+        with self._lock:
+            self._created.add(path)
+
+        return path
+
+
+    def directory(self, kind: QSP.StandardLocation, relative_dir: str = ""
+                 ) -> str:
+        key = (int(kind), relative_dir)
+
+        with self._lock:
+            if key in self._dirs:
+                return self._dirs[key]
+
+        base_dir = QSP.writableLocation(kind)
+
+        if not base_dir.rstrip(os.sep).endswith(f"{os.sep}{__pkg_name__}"):
+            base_dir = f"{base_dir}{os.sep}{__pkg_name__}"
+
+        path = os.path.join(base_dir, *relative_dir.split("/")) \
+               if relative_dir else base_dir
+        self.ensure_dir(path)
+
+        with self._lock:
+            self._dirs[key] = path
 
-    path = QSP.locate(kind, relative_path)
-    if path:
         return path
 
-    base_dir = QSP.writableLocation(kind)
 
-    if not base_dir.rstrip(os.sep).endswith(f"{os.sep}{__pkg_name__}"):
-        base_dir = f"{base_dir}{os.sep}{__pkg_name__}"
+    def file(self,
+             kind:            QSP.StandardLocation,
+             file:            str,
+             initial_content: Optional[str] = None) -> str:
+        key = (int(kind), file)
 
-    path = f"{base_dir}{os.sep}{relative_path}"
-    os.makedirs(os.path.split(path)[0], exist_ok=True)
+        with self._lock:
+            if key in self._files:
+                return self._files[key]
 
-    if not (initial_content is None or os.path.exists(path)):
-        with AtomicFile(path, "w") as new:
-            new.write(initial_content)
+        path = QSP.locate(kind, file.replace("/", os.sep))
 
-    return path
+        if not path:
+            relative_dir, _, name = file.rpartition("/")
+            path = f"{self.directory(kind, relative_dir)}{os.sep}{name}"
+
+            if not (initial_content is None or os.path.exists(path)):
+                with AtomicFile(path, "w") as new:
+                    new.write(initial_content)
+
+        with self._lock:
+            self._files[key] = path
+
+        return path
+
+
+PATHS = PathResolver()
+
+
+def get_standard_path(kind:            QSP.StandardLocation,
+                      file:            str,
+                      initial_content: Optional[str] = None) -> str:
+    return PATHS.file(kind, file, initial_content)
 
 
 def get_config_path(file: str, initial_content: Optional[str] = None) -> str:
@@ -40,7 +40,6 @@ setup(
         "pygments",  # for markdown2 fenced code blocks coloring
 
         "cachetools",
-        "kids.cache",
     ],
 
 
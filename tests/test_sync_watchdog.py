@@ -0,0 +1,109 @@
+# Copyright 2018 miruka
+# This file is part of harmonyqt, licensed under GPLv3.
+
+import threading
+import time
+import unittest
+
+from matrix_client.api import MatrixHttpApi
+
+from harmonyqt.sync_watchdog import SyncWatchdog
+
+TIMEOUT_MS  = 500
+STALL_GRACE = 0.5
+# Maximum seconds the watchdog can take to react after a request stalled
+MAX_DELAY   = TIMEOUT_MS / 1000 + 5
+
+
+class FakeClient:
+    "Only what `SyncWatchdog` uses of a `MatrixClient`, without a server."
+
+    def __init__(self) -> None:
+        self.api     = MatrixHttpApi("http://127.0.0.1:1", token="token")
+        self.syncs   = 0
+        self.release = threading.Event()
+        self.api.sync = self._blocking_sync  # Copied by the watchdog
+
+
+    def _blocking_sync(self, since=None, timeout_ms=30_000, **_) -> dict:
+        self.syncs += 1
+        if self.syncs == 1:  # Like a long-poll hanging after a network drop
+            self.release.wait(60)
+        return {"next_batch": str(self.syncs)}
+
+
+    def _sync(self, timeout_ms: int = 30_000) -> None:
+        self.api.sync(None, timeout_ms)
+        time.sleep(0.05)
+
+
+class TestStalledSync(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = FakeClient()
+        self.states: list = []
+        self.errors: list = []
+
+        self.watchdog = SyncWatchdog(self.client,
+                                     timeout_ms      = TIMEOUT_MS,
+                                     stall_grace     = STALL_GRACE,
+                                     check_interval  = 0.1,
+                                     on_state_change = self.states.append,
+                                     on_error        = self.errors.append)
+
+
+    def tearDown(self) -> None:
+        self.watchdog.stop()
+        self.client.release.set()
+
+
+    def wait_for(self, condition, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.05)
+        return condition()
+
+
+    def test_restart_after_stall(self) -> None:
+        self.watchdog.start()
+
+        self.assertTrue(
+            self.wait_for(lambda: self.watchdog.restarts >= 1, MAX_DELAY),
+            "Stalled sync request was not abandoned",
+        )
+        self.assertIn("stalled", self.states)
+
+        self.assertTrue(
+            self.wait_for(lambda: self.watchdog.state == "connected",
+                          MAX_DELAY),
+            "No successful sync after restarting",
+        )
+        self.assertEqual(self.states, ["stalled", "connected"])
+        self.assertEqual(self.errors, [])
+
+
+    def test_shared_session_kept(self) -> None:
+        session = self.client.api.session
+        self.watchdog.start()
+        self.wait_for(lambda: self.watchdog.restarts >= 1, MAX_DELAY)
+
+        # Other API calls may be using it, only the sync session is replaced
+        self.assertIs(self.client.api.session, session)
+
+
+    def test_late_response_discarded(self) -> None:
+        self.watchdog.start()
+        self.wait_for(lambda: self.watchdog.state == "connected", MAX_DELAY)
+
+        syncs = self.client.syncs
+        self.client.release.set()  # The abandoned request finally returns
+        time.sleep(0.3)
+
+        self.assertEqual(self.watchdog.restarts, 1)
+        self.assertEqual(self.states, ["stalled", "connected"])
+        self.assertGreater(self.client.syncs, syncs)
+
+
+if __name__ == "__main__":
+    unittest.main()